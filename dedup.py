@@ -11,22 +11,40 @@ import os
 import io
 import json
 import time
-import hashlib
+import ctypes
+import asyncio
 import logging
 import argparse
+import platform
 import sqlite3
+import subprocess
 from datetime import datetime, timedelta
 from pathlib import Path
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
+import aiohttp
+import blake3
 import imagehash
+import numpy as np
+import scipy.fft
 from PIL import Image
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
+try:
+    from numba import njit, prange
+    from numba.extending import intrinsic
+except ImportError:  # numba is optional; Hamming distances fall back to NumPy
+    njit = None
+
+try:
+    import faiss
+except ImportError:  # faiss is optional; similar pairs fall back to NumPy
+    faiss = None
+
 # --- Configuration ---
 SCOPES = ["https://www.googleapis.com/auth/photoslibrary.readonly"]
 DB_PATH = Path(__file__).parent / "photos.db"
@@ -34,10 +52,16 @@ CREDENTIALS_PATH = Path(__file__).parent / "credentials.json"
 TOKEN_PATH = Path(__file__).parent / "token.json"
 REPORT_DIR = Path(__file__).parent / "reports"
 CACHE_DIR = Path(__file__).parent / "cache"
+HASH_CACHE_PATH = CACHE_DIR / "hashes.npz"
+THUMBNAIL_CACHE_DIR = CACHE_DIR / "thumbnails"
+HAMMING_SRC = Path(__file__).parent / "hamming.c"
 HASH_SIZE = 16  # Higher = more precise perceptual hash
 SIMILARITY_THRESHOLD = 10  # Hamming distance; lower = stricter matching
 BATCH_SIZE = 100  # Google API page size (max 100)
-DOWNLOAD_THREADS = 8  # Parallel thumbnail downloads
+DOWNLOAD_CONNECTIONS = 32  # Concurrent thumbnail downloads (pooled keep-alive connections)
+HASH_WORKERS = os.cpu_count() or 4  # Processes decoding + hashing thumbnails
+MAX_IN_FLIGHT = 200  # Thumbnails downloaded but not yet hashed (bounds memory)
+COMMIT_EVERY = 10_000  # Rows per transaction while scanning
 LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
 
 logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
@@ -51,6 +75,10 @@ logger = logging.getLogger("dedup")
 def init_db(db_path: Path = DB_PATH) -> sqlite3.Connection:
     conn = sqlite3.connect(str(db_path))
     conn.execute("PRAGMA journal_mode=WAL")
+    # WAL only needs fsync at checkpoints with synchronous=NORMAL; still crash-safe
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")  # 64 MiB page cache
     conn.execute("""
         CREATE TABLE IF NOT EXISTS photos (
             id TEXT PRIMARY KEY,
@@ -61,12 +89,54 @@ def init_db(db_path: Path = DB_PATH) -> sqlite3.Connection:
             height INTEGER,
             base_url TEXT,
             product_url TEXT,
-            phash TEXT,
-            dhash TEXT,
+            phash BLOB,
+            dhash BLOB,
             md5 TEXT,
             scanned_at TEXT
         )
     """)
+    # Duplicate groups from the last find_duplicates run, so the next run only
+    # has to compare newly scanned photos (see load_union_find)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS union_find (
+            id TEXT PRIMARY KEY,
+            parent TEXT NOT NULL,
+            rank INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dedup_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+    migrate_hashes_to_blob(conn)
+    create_indexes(conn)
+    return conn
+
+
+def migrate_hashes_to_blob(conn: sqlite3.Connection):
+    """One-shot rewrite of hex TEXT hashes (older databases) as raw BLOBs."""
+    rows = conn.execute(
+        "SELECT id, phash, dhash FROM photos WHERE typeof(phash) = 'text'"
+    ).fetchall()
+    if not rows:
+        return
+
+    logger.info(f"Migrating {len(rows)} hex hashes to BLOB storage...")
+    conn.executemany(
+        "UPDATE photos SET phash = ?, dhash = ? WHERE id = ?",
+        [
+            (bytes.fromhex(phash.zfill(len(phash) + len(phash) % 2)),
+             bytes.fromhex(dhash.zfill(len(dhash) + len(dhash) % 2)) if dhash else None,
+             pid)
+            for pid, phash, dhash in rows
+        ],
+    )
+    conn.commit()
+
+
+def create_indexes(conn: sqlite3.Connection):
     conn.execute("""
         CREATE INDEX IF NOT EXISTS idx_phash ON photos(phash)
     """)
@@ -74,7 +144,64 @@ def init_db(db_path: Path = DB_PATH) -> sqlite3.Connection:
         CREATE INDEX IF NOT EXISTS idx_dhash ON photos(dhash)
     """)
     conn.commit()
-    return conn
+
+
+def drop_indexes(conn: sqlite3.Connection):
+    """Drop secondary indexes so a bulk load doesn't pay B-tree upkeep per row."""
+    conn.execute("DROP INDEX IF EXISTS idx_phash")
+    conn.execute("DROP INDEX IF EXISTS idx_dhash")
+    conn.commit()
+
+
+def load_union_find(conn: sqlite3.Connection, ids: list, threshold: int):
+    """
+    Return (parent, rank, new) from the last find_duplicates run, with `new`
+    the indices into `ids` of photos scanned since then, or None when the
+    saved groups can't be extended (first run, different threshold, or
+    photos that were rescanned and may have changed hash).
+    """
+    state = dict(conn.execute("SELECT key, value FROM dedup_state"))
+    if "last_run" not in state or state.get("threshold") != str(threshold):
+        return None
+
+    index = {pid: i for i, pid in enumerate(ids)}
+    parent = np.arange(len(ids), dtype=np.int32)
+    rank = np.zeros(len(ids), dtype=np.int8)
+    known = np.zeros(len(ids), dtype=bool)
+    for pid, parent_id, r in conn.execute("SELECT id, parent, rank FROM union_find"):
+        if pid not in index or parent_id not in index:
+            return None
+        i = index[pid]
+        parent[i] = index[parent_id]
+        rank[i] = r
+        known[i] = True
+
+    new = np.array(
+        [index[pid] for (pid,) in conn.execute(
+            "SELECT id FROM photos WHERE scanned_at > ?", (state["last_run"],)
+        )],
+        dtype=np.int64,
+    )
+    # Every photo must be either in the saved groups or new since, not both
+    if known[new].any() or known.sum() != len(ids) - len(new):
+        return None
+    return parent, rank, new
+
+
+def save_union_find(conn: sqlite3.Connection, ids: list, parent: np.ndarray,
+                    rank: np.ndarray, threshold: int, last_run: str):
+    """Persist the union-find for the next incremental find_duplicates run."""
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("DELETE FROM union_find")
+    conn.executemany(
+        "INSERT INTO union_find (id, parent, rank) VALUES (?, ?, ?)",
+        zip(ids, [ids[p] for p in parent.tolist()], rank.tolist()),
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO dedup_state (key, value) VALUES (?, ?)",
+        [("last_run", last_run), ("threshold", str(threshold))],
+    )
+    conn.commit()
 
 
 # ============================================================
@@ -152,6 +279,8 @@ def list_all_photos(service, conn: sqlite3.Connection, full_scan: bool = False):
                 # Only process images, skip videos
                 if item.get("mimeType", "").startswith("image/"):
                     new_photos.append(item)
+                    # Never queue an id twice, so scan_photos can use plain INSERTs
+                    existing_ids.add(item["id"])
 
         logger.info(f"Fetched {total_fetched} items from API ({len(new_photos)} new images)...")
 
@@ -167,193 +296,543 @@ def list_all_photos(service, conn: sqlite3.Connection, full_scan: bool = False):
 # Thumbnail Download & Hashing
 # ============================================================
 
-def download_and_hash(item: dict) -> dict | None:
-    """Download a thumbnail and compute perceptual + MD5 hashes."""
-    import requests
+def fast_phash(img: Image.Image, hash_size: int = HASH_SIZE) -> bytes:
+    """
+    Same hash as imagehash.phash, but with one pocketfft 2-D DCT on a float
+    copy of the pixels instead of two scipy.fftpack passes.
+    """
+    size = hash_size * 4
+    pixels = np.asarray(img.convert("L").resize((size, size), Image.LANCZOS), dtype=np.float64)
+    dct = scipy.fft.dctn(pixels, type=2, workers=1, overwrite_x=True)
+    low = dct[:hash_size, :hash_size]
+    return np.packbits(low > np.median(low)).tobytes()
+
+
+def hash_thumbnail(item: dict, img_bytes: bytes) -> dict:
+    """Compute perceptual + content hashes for a downloaded thumbnail."""
+    # Both hashes work on luminance only. For JPEGs, draft() makes libjpeg
+    # decode straight to grayscale at the smallest scale still >= 64px.
+    img = Image.open(io.BytesIO(img_bytes))
+    img.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))
+    img = img.convert("L")
+
+    phash = fast_phash(img)
+    dhash = np.packbits(imagehash.dhash(img, hash_size=HASH_SIZE).hash).tobytes()
+    # Content hash for exact-duplicate checks; BLAKE3 uses SIMD and is much
+    # faster than MD5. Truncated to 128 bits to keep the md5 column's width.
+    md5 = blake3.blake3(img_bytes).hexdigest(length=16)
+
+    metadata = item.get("mediaMetadata", {})
+    return {
+        "id": item["id"],
+        "filename": item.get("filename", ""),
+        "mime_type": item.get("mimeType", ""),
+        "creation_time": metadata.get("creationTime", ""),
+        "width": int(metadata.get("width", 0)),
+        "height": int(metadata.get("height", 0)),
+        "base_url": item.get("baseUrl", ""),
+        "product_url": item.get("productUrl", ""),
+        "phash": phash,
+        "dhash": dhash,
+        "md5": md5,
+        "scanned_at": datetime.utcnow().isoformat(),
+    }
+
+
+def thumbnail_cache_path(photo_id: str) -> Path:
+    """Where a photo's downloaded thumbnail is kept, sharded by id prefix."""
+    return THUMBNAIL_CACHE_DIR / photo_id[:2] / photo_id
+
+
+def read_cached_thumbnail(photo_id: str) -> bytes | None:
+    try:
+        return thumbnail_cache_path(photo_id).read_bytes() or None
+    except FileNotFoundError:
+        return None
+
 
-    media_id = item["id"]
-    # Request a 512px thumbnail — good enough for perceptual hashing
-    base_url = item.get("baseUrl", "")
-    thumb_url = f"{base_url}=w512-h512"
+def save_thumbnail(photo_id: str, img_bytes: bytes):
+    path = thumbnail_cache_path(photo_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_bytes(img_bytes)
+    os.replace(tmp_path, path)  # Never leave a truncated thumbnail behind
+
+
+async def download_and_hash(
+    session: aiohttp.ClientSession, item: dict, cpu_pool, in_flight: asyncio.Semaphore
+) -> dict | None:
+    """
+    Download a thumbnail (or read it from the thumbnail cache), then hash it
+    in `cpu_pool` off the event loop.
+    """
+    # Request a 256px thumbnail — phash only looks at a 4 * HASH_SIZE square
+    thumb_url = f"{item.get('baseUrl', '')}=w256-h256"
 
     try:
-        resp = requests.get(thumb_url, timeout=30)
-        resp.raise_for_status()
-        img_bytes = resp.content
-
-        img = Image.open(io.BytesIO(img_bytes))
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-
-        phash = str(imagehash.phash(img, hash_size=HASH_SIZE))
-        dhash = str(imagehash.dhash(img, hash_size=HASH_SIZE))
-        md5 = hashlib.md5(img_bytes).hexdigest()
-
-        metadata = item.get("mediaMetadata", {})
-        return {
-            "id": media_id,
-            "filename": item.get("filename", ""),
-            "mime_type": item.get("mimeType", ""),
-            "creation_time": metadata.get("creationTime", ""),
-            "width": int(metadata.get("width", 0)),
-            "height": int(metadata.get("height", 0)),
-            "base_url": base_url,
-            "product_url": item.get("productUrl", ""),
-            "phash": phash,
-            "dhash": dhash,
-            "md5": md5,
-            "scanned_at": datetime.utcnow().isoformat(),
-        }
+        # Held from download until hashing finishes, so a slow CPU pool
+        # can't let downloaded bytes pile up in memory
+        async with in_flight:
+            # Media items are immutable per id, so a cached thumbnail is
+            # always current; rescans and --rehash skip the network entirely
+            img_bytes = read_cached_thumbnail(item["id"])
+            if img_bytes is None:
+                async with session.get(thumb_url) as resp:
+                    resp.raise_for_status()
+                    img_bytes = await resp.read()
+                save_thumbnail(item["id"], img_bytes)
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(cpu_pool, hash_thumbnail, item, img_bytes)
     except Exception as e:
-        logger.warning(f"Failed to process {item.get('filename', media_id)}: {e}")
+        logger.warning(f"Failed to process {item.get('filename', item['id'])}: {e}")
         return None
 
 
-def scan_photos(photos: list, conn: sqlite3.Connection):
-    """Download thumbnails and compute hashes in parallel, storing results in DB."""
-    logger.info(f"Scanning {len(photos)} new photos with {DOWNLOAD_THREADS} threads...")
+def cached_photo_items(conn: sqlite3.Connection) -> list:
+    """
+    Rebuild API-style media items for stored photos whose thumbnails are
+    cached, so they can be rehashed without listing the library again.
+    """
+    items = []
+    missing = 0
+    for row in conn.execute(
+        "SELECT id, filename, mime_type, creation_time, width, height, base_url, product_url "
+        "FROM photos"
+    ):
+        pid, filename, mime_type, creation_time, width, height, base_url, product_url = row
+        if not thumbnail_cache_path(pid).is_file():
+            missing += 1
+            continue
+        items.append({
+            "id": pid,
+            "filename": filename,
+            "mimeType": mime_type,
+            "baseUrl": base_url,
+            "productUrl": product_url,
+            "mediaMetadata": {"creationTime": creation_time, "width": width, "height": height},
+        })
+
+    if missing:
+        logger.warning(f"{missing} photos have no cached thumbnail; use --full-scan to re-download them.")
+    return items
+
 
+def scan_photos(photos: list, conn: sqlite3.Connection, replace: bool = False):
+    """
+    Download thumbnails and compute hashes in parallel, storing results in DB.
+    Pass replace=True when rescanning photos that may already be stored.
+    """
+    logger.info(
+        f"Scanning {len(photos)} new photos with {DOWNLOAD_CONNECTIONS} connections "
+        f"and {HASH_WORKERS} hash processes..."
+    )
+    asyncio.run(_scan_photos(photos, conn, replace))
+
+
+async def _scan_photos(photos: list, conn: sqlite3.Connection, replace: bool):
     processed = 0
+    uncommitted = 0
     batch = []
 
-    with ThreadPoolExecutor(max_workers=DOWNLOAD_THREADS) as executor:
-        futures = {executor.submit(download_and_hash, p): p for p in photos}
+    # One keep-alive pool for the whole scan, so connections (and TLS sessions)
+    # to googleusercontent.com are reused across thumbnails
+    connector = aiohttp.TCPConnector(limit=DOWNLOAD_CONNECTIONS, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=30)
+    in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
 
-        for future in as_completed(futures):
-            result = future.result()
-            if result:
-                batch.append(result)
+    # One transaction per COMMIT_EVERY rows instead of an fsync per small batch,
+    # taking the write lock up front rather than upgrading on the first INSERT
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Decoding and DCTs are CPU-bound and don't reliably release the GIL,
+        # so they run in worker processes, separate from the download pool
+        with ProcessPoolExecutor(max_workers=HASH_WORKERS) as cpu_pool:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                tasks = [download_and_hash(session, p, cpu_pool, in_flight) for p in photos]
+
+                for next_done in asyncio.as_completed(tasks):
+                    result = await next_done
+                    if result:
+                        batch.append(result)
+
+                    processed += 1
+                    if processed % 100 == 0:
+                        logger.info(f"  Processed {processed}/{len(photos)}...")
+
+                    # Batch insert every 500 items
+                    if len(batch) >= 500:
+                        _insert_batch(conn, batch, replace)
+                        uncommitted += len(batch)
+                        batch = []
+
+                    if uncommitted >= COMMIT_EVERY:
+                        conn.commit()
+                        conn.execute("BEGIN IMMEDIATE")
+                        uncommitted = 0
+
+        if batch:
+            _insert_batch(conn, batch, replace)
+    finally:
+        # Keep whatever was scanned, even if the run is interrupted
+        conn.commit()
 
-            processed += 1
-            if processed % 100 == 0:
-                logger.info(f"  Processed {processed}/{len(photos)}...")
+    logger.info(f"Scanning complete. {processed} photos processed.")
 
-            # Batch insert every 500 items
-            if len(batch) >= 500:
-                _insert_batch(conn, batch)
-                batch = []
 
-    if batch:
-        _insert_batch(conn, batch)
+PHOTO_COLUMNS = (
+    "id", "filename", "mime_type", "creation_time", "width", "height",
+    "base_url", "product_url", "phash", "dhash", "md5", "scanned_at",
+)
+# Rows per multi-row INSERT; SQLite before 3.32 caps a statement at 999 parameters
+INSERT_CHUNK = 200 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999 // len(PHOTO_COLUMNS)
 
-    logger.info(f"Scanning complete. {processed} photos processed.")
 
+def _insert_batch(conn: sqlite3.Connection, batch: list, replace: bool = False):
+    """
+    Insert rows with multi-row VALUES statements. The caller commits.
 
-def _insert_batch(conn: sqlite3.Connection, batch: list):
-    conn.executemany(
-        """
-        INSERT OR REPLACE INTO photos
-        (id, filename, mime_type, creation_time, width, height,
-         base_url, product_url, phash, dhash, md5, scanned_at)
-        VALUES (:id, :filename, :mime_type, :creation_time, :width, :height,
-                :base_url, :product_url, :phash, :dhash, :md5, :scanned_at)
-        """,
-        batch,
-    )
-    conn.commit()
+    New photos use a plain INSERT; OR REPLACE (a delete plus an insert on
+    every index when the id exists) is only needed when rescanning.
+    """
+    verb = "INSERT OR REPLACE" if replace else "INSERT"
+    row_sql = "(" + ", ".join("?" * len(PHOTO_COLUMNS)) + ")"
+    for start in range(0, len(batch), INSERT_CHUNK):
+        chunk = batch[start:start + INSERT_CHUNK]
+        conn.execute(
+            f"{verb} INTO photos ({', '.join(PHOTO_COLUMNS)}) VALUES "
+            + ", ".join([row_sql] * len(chunk)),
+            [photo[col] for photo in chunk for col in PHOTO_COLUMNS],
+        )
 
 
 # ============================================================
 # Duplicate Detection
 # ============================================================
 
-def hex_to_hash(hex_str: str) -> imagehash.ImageHash:
-    """Convert hex string back to ImageHash for comparison."""
-    return imagehash.hex_to_hash(hex_str)
+def hash_words(raw: bytes) -> np.ndarray:
+    """View a packed hash as uint64 words (left-padded to a whole word)."""
+    width = -(-len(raw) // 8) * 8
+    return np.frombuffer(raw.rjust(width, b"\0"), dtype=np.uint64)
+
+
+# Number of set bits in each possible byte value; indexing this with an XOR of
+# two packed hashes and summing per row gives their Hamming distance.
+POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _pair_distances_numpy(hashes: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    xor = np.bitwise_xor(hashes[a], hashes[b]).view(np.uint8)
+    return POPCOUNT8[xor].sum(axis=1)
+
+
+if njit is not None:
+    @intrinsic
+    def _popcount(typingctx, x):
+        """Lower to LLVM ctpop, which becomes POPCNT on x86-64 and CNT on ARM."""
+        def codegen(context, builder, signature, args):
+            return builder.ctpop(args[0])
+        return x(x), codegen
+
+    @njit(cache=True, parallel=True)
+    def _pair_distances_numba(hashes, a, b):
+        out = np.empty(len(a), dtype=np.int64)
+        for k in prange(len(a)):
+            d = 0
+            for w in range(hashes.shape[1]):
+                d += _popcount(hashes[a[k], w] ^ hashes[b[k], w])
+            out[k] = d
+        return out
+
+
+def _compile_hamming(lib_path: Path) -> bool:
+    """Build hamming.c into lib_path for this CPU; False if no compiler can."""
+    CACHE_DIR.mkdir(exist_ok=True)
+    tmp_path = lib_path.with_name(f"{lib_path.name}.{os.getpid()}.tmp")
+    cc = os.environ.get("CC", "cc")
+    # -march=native selects the AVX-512/AVX2 path; some ARM compilers reject it,
+    # and AArch64 has NEON without any flag
+    for arch_flags in (["-march=native"], []):
+        cmd = [cc, "-O3", *arch_flags, "-shared", "-fPIC", "-o", str(tmp_path), str(HAMMING_SRC)]
+        try:
+            subprocess.run(cmd, check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError):
+            continue
+        os.replace(tmp_path, lib_path)
+        return True
+    return False
+
+
+@lru_cache(maxsize=None)
+def _hamming_kernel():
+    """
+    Return the fastest available pair_distances implementation: the C kernel
+    in hamming.c (compiled once per source version and machine into
+    CACHE_DIR), else Numba, else NumPy.
+    """
+    fallback = _pair_distances_numba if njit is not None else _pair_distances_numpy
+
+    version = blake3.blake3(HAMMING_SRC.read_bytes()).hexdigest(length=8)
+    lib_path = CACHE_DIR / f"hamming-{version}-{platform.machine()}.so"
+    if not lib_path.exists() and not _compile_hamming(lib_path):
+        logger.info(f"No C compiler for {HAMMING_SRC.name}; using {fallback.__name__}.")
+        return fallback
+
+    try:
+        lib = ctypes.CDLL(str(lib_path))
+    except OSError as e:
+        logger.warning(f"Could not load {lib_path.name}: {e}")
+        return fallback
+
+    lib.hamming_isa.restype = ctypes.c_char_p
+    lib.hamming_pair_distances.restype = None
+    lib.hamming_pair_distances.argtypes = [
+        np.ctypeslib.ndpointer(np.uint64, flags="C_CONTIGUOUS"), ctypes.c_size_t,
+        np.ctypeslib.ndpointer(np.int64, flags="C_CONTIGUOUS"),
+        np.ctypeslib.ndpointer(np.int64, flags="C_CONTIGUOUS"), ctypes.c_size_t,
+        np.ctypeslib.ndpointer(np.int64, flags="C_CONTIGUOUS"),
+    ]
+    logger.info(f"Hamming distances: {HAMMING_SRC.name} ({lib.hamming_isa().decode()}).")
+
+    def _pair_distances_c(hashes, a, b):
+        hashes = np.ascontiguousarray(hashes, dtype=np.uint64)
+        a = np.ascontiguousarray(a, dtype=np.int64)
+        b = np.ascontiguousarray(b, dtype=np.int64)
+        out = np.empty(len(a), dtype=np.int64)
+        lib.hamming_pair_distances(hashes, hashes.shape[1], a, b, len(a), out)
+        return out
+
+    return _pair_distances_c
+
+
+def pair_distances(hashes: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Hamming distance between rows a[k] and b[k] of `hashes`, for every k."""
+    return _hamming_kernel()(hashes, a, b)
+
+
+def similar_pairs(hashes: np.ndarray, threshold: int, query: np.ndarray = None) -> np.ndarray:
+    """
+    Return every (i, j), i < j, whose rows in the (n, words) uint64 `hashes`
+    array are within `threshold` bits of each other. With `query` (row
+    indices), only pairs involving at least one of those rows are returned.
+
+    Multi-index hashing: the bits are split into at least threshold + 1
+    disjoint ranges. By the pigeonhole principle, two hashes that differ in
+    at most `threshold` bits agree exactly on at least one range, so grouping
+    rows on each range in turn yields a candidate set with no false negatives.
+    Candidates are deduplicated across ranges and then verified in one batch.
+
+    Full searches go to faiss's binary multi-hash index when faiss is
+    installed; for a few query rows, building that index would dominate.
+    """
+    n = len(hashes)
+    if n < 2 or (query is not None and len(query) == 0):
+        return np.empty((0, 2), dtype=np.int64)
+    if faiss is not None and query is None:
+        return _similar_pairs_faiss(hashes, threshold)
+
+    is_query = None
+    if query is not None:
+        is_query = np.zeros(n, dtype=bool)
+        is_query[query] = True
+
+    bits = np.unpackbits(np.ascontiguousarray(hashes).view(np.uint8), axis=1)
+    n_bits = bits.shape[1]
+    # Keep every range within 64 bits so it can be sorted as a single uint64 key
+    n_ranges = max(threshold + 1, -(-n_bits // 64))
+    bounds = np.linspace(0, n_bits, n_ranges + 1).astype(int)
+
+    candidates = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        packed = np.zeros((n, 8), dtype=np.uint8)
+        chunk = np.packbits(bits[:, lo:hi], axis=1)
+        packed[:, :chunk.shape[1]] = chunk
+        keys = packed.view(np.uint64).ravel()
+
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], n]
+        shared = ends - starts > 1
+        if is_query is not None:
+            shared &= np.add.reduceat(is_query[order], starts) > 0
+        for start, end in zip(starts[shared], ends[shared]):
+            run = order[start:end]  # Ascending, since the sort is stable
+            if is_query is None:
+                i, j = np.triu_indices(len(run), 1)
+                candidates.append(run[i].astype(np.int64) * n + run[j])
+            else:
+                # Only the queried rows against the rest of the run
+                q = run[is_query[run]].astype(np.int64)
+                first, second = np.minimum.outer(q, run), np.maximum.outer(q, run)
+                distinct = first != second
+                candidates.append(first[distinct] * n + second[distinct])
+
+    if not candidates:
+        return np.empty((0, 2), dtype=np.int64)
+
+    # The same pair usually collides on several ranges; only verify it once
+    keys = np.unique(np.concatenate(candidates))
+    a, b = keys // n, keys % n
+    close = pair_distances(hashes, a, b) <= threshold
+    return np.stack([a[close], b[close]], axis=1)
+
+
+def _similar_pairs_faiss(hashes: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    similar_pairs() on faiss's IndexBinaryMultiHash: the same pigeonhole
+    split into threshold + 1 disjoint substrings (at most 64 bits each), so
+    the range search is exact, with lookups and verification done in C++.
+    """
+    codes = np.ascontiguousarray(hashes).view(np.uint8)
+    n_bits = codes.shape[1] * 8
+    n_ranges = max(threshold + 1, -(-n_bits // 64))
+
+    index = faiss.IndexBinaryMultiHash(n_bits, n_ranges, n_bits // n_ranges)
+    index.add(codes)
+    # Binary range search keeps distances strictly below the radius
+    lims, _, found = index.range_search(codes, threshold + 1)
+
+    query = np.repeat(np.arange(len(codes)), np.diff(lims).astype(np.int64))
+    keep = query < found  # Each pair is reported from both ends, and to itself
+    return np.stack([query[keep], found[keep]], axis=1)
+
+
+def load_hashes(conn: sqlite3.Connection) -> tuple:
+    """
+    Return (ids, phashes, md5s) for every photo, oldest first: phashes as an
+    (n, words) uint64 array and content hashes as an (n, 16) uint8 array.
+
+    Served from HASH_CACHE_PATH while it is newer than the latest scan, so
+    repeated --report-only runs skip decoding every row.
+    """
+    count, last_scan = conn.execute("SELECT COUNT(*), MAX(scanned_at) FROM photos").fetchone()
+    if HASH_CACHE_PATH.exists():
+        cached_at = datetime.utcfromtimestamp(HASH_CACHE_PATH.stat().st_mtime).isoformat()
+        if last_scan is None or cached_at > last_scan:
+            with np.load(HASH_CACHE_PATH) as cache:
+                if len(cache["ids"]) == count:
+                    return cache["ids"].tolist(), cache["phashes"], cache["md5s"]
+
+    # Single streaming pass over just the columns needed for matching; the
+    # report loads the remaining fields for the photos it actually shows.
+    ids = []
+    phashes = []
+    md5s = []
+    for pid, phash, md5 in conn.execute(
+        "SELECT id, phash, md5 FROM photos ORDER BY creation_time"
+    ):
+        ids.append(pid)
+        phashes.append(hash_words(phash))
+        md5s.append(bytes.fromhex(md5 or "")[:16].ljust(16, b"\0"))
+
+    phashes = np.stack(phashes) if phashes else np.empty((0, 1), dtype=np.uint64)
+    md5s = np.frombuffer(b"".join(md5s), dtype=np.uint8).reshape(-1, 16)
+
+    CACHE_DIR.mkdir(exist_ok=True)
+    tmp_path = HASH_CACHE_PATH.with_suffix(".tmp.npz")
+    np.savez(tmp_path, ids=np.array(ids, dtype=str), phashes=phashes, md5s=md5s)
+    os.replace(tmp_path, HASH_CACHE_PATH)
+
+    return ids, phashes, md5s
+
+
+def _find(parent, x):
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]  # Path halving
+        x = parent[x]
+    return x
+
+
+def _union_pairs(parent, rank, pairs):
+    """Union-by-rank over every (a, b) row of `pairs`, on dense int indices."""
+    for k in range(len(pairs)):
+        ra = _find(parent, pairs[k, 0])
+        rb = _find(parent, pairs[k, 1])
+        if ra == rb:
+            continue
+        if rank[ra] < rank[rb]:
+            ra, rb = rb, ra
+        parent[rb] = ra
+        if rank[ra] == rank[rb]:
+            rank[ra] += 1
+
+
+def _find_roots(parent):
+    roots = np.empty_like(parent)
+    for x in range(len(parent)):
+        roots[x] = _find(parent, x)
+    return roots
+
+
+if njit is not None:
+    _find = njit(cache=True)(_find)
+    _union_pairs = njit(cache=True)(_union_pairs)
+    _find_roots = njit(cache=True)(_find_roots)
 
 
 def find_duplicates(conn: sqlite3.Connection, threshold: int = SIMILARITY_THRESHOLD) -> list:
     """
     Find duplicate groups using perceptual hash similarity.
-    Returns list of groups, each group is a list of photo dicts.
+    Returns list of groups, each group is a list of photo ids ordered oldest first.
     """
     logger.info("Finding duplicates...")
 
-    cursor = conn.execute(
-        "SELECT id, filename, creation_time, width, height, product_url, phash, dhash, md5 "
-        "FROM photos ORDER BY creation_time"
-    )
-    all_photos = cursor.fetchall()
-    columns = ["id", "filename", "creation_time", "width", "height", "product_url", "phash", "dhash", "md5"]
+    last_run = conn.execute("SELECT MAX(scanned_at) FROM photos").fetchone()[0] or ""
+    ids, phashes, md5s = load_hashes(conn)
 
-    # --- Pass 1: Exact MD5 duplicates ---
-    md5_groups = defaultdict(list)
-    for row in all_photos:
-        photo = dict(zip(columns, row))
-        md5_groups[photo["md5"]].append(photo)
+    # Union-Find over dense int32 photo indices (position in `ids`), carried
+    # over from the last run when only new photos need comparing
+    saved = load_union_find(conn, ids, threshold)
+    if saved is not None:
+        parent, rank, new = saved
+        logger.info(f"Comparing {len(new)} new photos against {len(ids)}.")
+    else:
+        parent = np.arange(len(ids), dtype=np.int32)
+        rank = np.zeros(len(ids), dtype=np.int8)
+        new = None
 
-    exact_dupes = {k: v for k, v in md5_groups.items() if len(v) > 1}
-    logger.info(f"Found {len(exact_dupes)} exact duplicate groups (MD5 match).")
+    # --- Pass 1: Exact content-hash duplicates ---
+    exact_dupes = 0
+    if len(md5s):
+        _, counts = np.unique(md5s, axis=0, return_counts=True)
+        exact_dupes = int((counts > 1).sum())
+    logger.info(f"Found {exact_dupes} exact duplicate groups (content hash match).")
 
     # --- Pass 2: Perceptual hash similarity (for memes/screenshots) ---
-    # Use Union-Find for grouping
-    parent = {}
-
-    def find(x):
-        while parent[x] != x:
-            parent[x] = parent[parent[x]]
-            x = parent[x]
-        return x
-
-    def union(a, b):
-        ra, rb = find(a), find(b)
-        if ra != rb:
-            parent[ra] = rb
-
-    photo_map = {}
-    hash_index = defaultdict(list)  # phash -> list of photo ids
-
-    for row in all_photos:
-        photo = dict(zip(columns, row))
-        pid = photo["id"]
-        parent[pid] = pid
-        photo_map[pid] = photo
-        hash_index[photo["phash"]].append(pid)
-
-    # First, group exact phash matches (fast)
-    for phash, ids in hash_index.items():
-        if len(ids) > 1:
-            for i in range(1, len(ids)):
-                union(ids[0], ids[i])
-
-    # Then, compare across different phashes using hamming distance
-    # For efficiency with 50k+ photos, we bucket by phash prefix
-    prefix_len = 8  # First 8 hex chars as bucket key
-    buckets = defaultdict(list)
-    unique_hashes = {}
-
-    for row in all_photos:
-        photo = dict(zip(columns, row))
-        pid = photo["id"]
-        phash_str = photo["phash"]
-        prefix = phash_str[:prefix_len]
-
-        # Check against all photos in nearby buckets
-        for existing_id, existing_hash_str in buckets.get(prefix, []):
-            if existing_id == pid:
-                continue
-            h1 = hex_to_hash(phash_str)
-            h2 = hex_to_hash(existing_hash_str)
-            distance = h1 - h2
-            if distance <= threshold:
-                union(pid, existing_id)
-
-        buckets[prefix].append((pid, phash_str))
+    # First, group exact phash matches: each photo joins the oldest one with
+    # its hash, so a cluster of identical hashes (blank frames, reposts)
+    # costs one union per photo rather than a candidate per pair and range
+    distinct, first, inverse = np.unique(
+        phashes, axis=0, return_index=True, return_inverse=True
+    )
+    inverse = inverse.ravel()  # NumPy 2.0 returned it with the unique axis kept
+    rep = first[inverse]
+    repeated = np.flatnonzero(rep != np.arange(len(ids)))
+    _union_pairs(parent, rank, np.stack([rep[repeated], repeated], axis=1).astype(np.int32))
+
+    # Then, compare the distinct hashes. Multi-index hashing finds every
+    # pair within the threshold (no prefix boundary misses) while only
+    # verifying pairs that share a bit range.
+    query = None if new is None else np.unique(inverse[new])
+    pairs = similar_pairs(distinct, threshold, query=query)
+    _union_pairs(parent, rank, first[pairs].astype(np.int32))
+    if new is None or len(new):
+        save_union_find(conn, ids, parent, rank, threshold, last_run)
 
     # Build groups
-    groups = defaultdict(list)
-    for pid in photo_map:
-        root = find(pid)
-        groups[root].append(photo_map[pid])
+    # (a stable sort keeps each group in creation order, i.e. oldest first)
+    roots = _find_roots(parent)
+    order = np.argsort(roots, kind="stable")
+    starts = np.flatnonzero(np.r_[True, roots[order][1:] != roots[order][:-1]])
+    members = np.split(order, starts[1:])
 
     # Filter to groups with 2+ members
-    duplicate_groups = [g for g in groups.values() if len(g) > 1]
+    members = [m for m in members if len(m) > 1]
 
-    # Sort groups: exact MD5 matches first, then by group size
-    for group in duplicate_groups:
-        group.sort(key=lambda p: p["creation_time"] or "")
-
-    duplicate_groups.sort(key=lambda g: len(g), reverse=True)
+    # Sort groups by size, then by their oldest photo
+    members.sort(key=lambda m: (-len(m), m[0]))
+    duplicate_groups = [[ids[i] for i in m] for m in members]
 
     total_dupes = sum(len(g) - 1 for g in duplicate_groups)
     logger.info(
@@ -368,181 +847,123 @@ def find_duplicates(conn: sqlite3.Connection, threshold: int = SIMILARITY_THRESH
 # HTML Report Generation
 # ============================================================
 
-def generate_report(duplicate_groups: list, conn: sqlite3.Connection) -> Path:
-    """Generate an HTML report with side-by-side duplicate comparisons."""
-    REPORT_DIR.mkdir(exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    report_path = REPORT_DIR / f"duplicates_{timestamp}.html"
-
-    # Refresh base URLs (they expire after ~1hr)
-    # We'll use product_url links instead for the report
-    total_dupes = sum(len(g) - 1 for g in duplicate_groups)
-
-    html = f"""<!DOCTYPE html>
+def load_photo_details(conn: sqlite3.Connection, ids: list) -> dict:
+    """Fetch the report fields for the given photo ids, keyed by id."""
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    details = {}
+    chunk_size = 500  # Stay well under SQLite's bound-parameter limit
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        placeholders = ", ".join("?" * len(chunk))
+        for row in cursor.execute(
+            "SELECT id, filename, creation_time, width, height, base_url, product_url, md5 "
+            f"FROM photos WHERE id IN ({placeholders})",
+            chunk,
+        ):
+            details[row["id"]] = dict(row)
+    return details
+
+
+_REPORT_HEAD = """<!DOCTYPE html>
 <html lang="en">
 <head>
 <meta charset="UTF-8">
 <meta name="viewport" content="width=device-width, initial-scale=1.0">
-<title>Google Photos Duplicate Report — {timestamp}</title>
-<style>
-  * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-  body {{
+"""
+
+_REPORT_STYLE = """<style>
+  * { margin: 0; padding: 0; box-sizing: border-box; }
+  body {
     font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
     background: #0f0f0f; color: #e0e0e0; padding: 24px;
-  }}
-  .header {{
+  }
+  .header {
     text-align: center; padding: 32px 0; border-bottom: 1px solid #333;
     margin-bottom: 32px;
-  }}
-  .header h1 {{ font-size: 28px; color: #fff; margin-bottom: 8px; }}
-  .header .stats {{ color: #888; font-size: 15px; }}
-  .stats span {{ color: #f59e0b; font-weight: 600; }}
-  .controls {{
+  }
+  .header h1 { font-size: 28px; color: #fff; margin-bottom: 8px; }
+  .header .stats { color: #888; font-size: 15px; }
+  .stats span { color: #f59e0b; font-weight: 600; }
+  .controls {
     position: sticky; top: 0; z-index: 100; background: #1a1a1a;
     padding: 16px 24px; border-radius: 12px; margin-bottom: 24px;
     display: flex; justify-content: space-between; align-items: center;
     border: 1px solid #333;
-  }}
-  .controls button {{
+  }
+  .controls button {
     background: #f59e0b; color: #000; border: none; padding: 10px 20px;
     border-radius: 8px; font-weight: 600; cursor: pointer; font-size: 14px;
-  }}
-  .controls button:hover {{ background: #d97706; }}
-  .controls button.danger {{ background: #ef4444; color: #fff; }}
-  .controls button.danger:hover {{ background: #dc2626; }}
-  .controls .selected-count {{ font-size: 14px; color: #888; }}
-  .group {{
+  }
+  .controls button:hover { background: #d97706; }
+  .controls button.danger { background: #ef4444; color: #fff; }
+  .controls button.danger:hover { background: #dc2626; }
+  .controls .selected-count { font-size: 14px; color: #888; }
+  .group {
     background: #1a1a1a; border-radius: 16px; padding: 24px;
     margin-bottom: 20px; border: 1px solid #2a2a2a;
-  }}
-  .group-header {{
+  }
+  .group-header {
     display: flex; justify-content: space-between; align-items: center;
     margin-bottom: 16px;
-  }}
-  .group-header h3 {{ font-size: 16px; color: #ccc; }}
-  .group-header .badge {{
+  }
+  .group-header h3 { font-size: 16px; color: #ccc; }
+  .group-header .badge {
     background: #f59e0b22; color: #f59e0b; padding: 4px 12px;
     border-radius: 20px; font-size: 13px; font-weight: 600;
-  }}
-  .group-header .badge.exact {{ background: #ef444422; color: #ef4444; }}
-  .photos {{
+  }
+  .group-header .badge.exact { background: #ef444422; color: #ef4444; }
+  .photos {
     display: grid; grid-template-columns: repeat(auto-fill, minmax(220px, 1fr));
     gap: 16px;
-  }}
-  .photo-card {{
+  }
+  .photo-card {
     position: relative; border-radius: 12px; overflow: hidden;
     border: 2px solid transparent; cursor: pointer; transition: all 0.2s;
-  }}
-  .photo-card:hover {{ border-color: #555; }}
-  .photo-card.selected {{ border-color: #ef4444; }}
-  .photo-card.keep {{ border-color: #22c55e; }}
-  .photo-card img {{
+  }
+  .photo-card:hover { border-color: #555; }
+  .photo-card.selected { border-color: #ef4444; }
+  .photo-card.keep { border-color: #22c55e; }
+  .photo-card img {
     width: 100%; aspect-ratio: 1; object-fit: cover; display: block;
-  }}
-  .photo-meta {{
+  }
+  .photo-meta {
     padding: 10px 12px; background: #111; font-size: 12px;
-  }}
-  .photo-meta .filename {{
+  }
+  .photo-meta .filename {
     color: #ccc; white-space: nowrap; overflow: hidden;
     text-overflow: ellipsis; margin-bottom: 4px;
-  }}
-  .photo-meta .details {{ color: #666; }}
-  .photo-card .keep-badge {{
+  }
+  .photo-meta .details { color: #666; }
+  .photo-card .keep-badge {
     position: absolute; top: 8px; left: 8px; background: #22c55e;
     color: #fff; font-size: 11px; font-weight: 700; padding: 3px 8px;
     border-radius: 6px;
-  }}
-  .photo-card .select-badge {{
+  }
+  .photo-card .select-badge {
     position: absolute; top: 8px; right: 8px; background: #ef4444;
     color: #fff; font-size: 11px; font-weight: 700; padding: 3px 8px;
     border-radius: 6px; display: none;
-  }}
-  .photo-card.selected .select-badge {{ display: block; }}
-  .photo-card a.open-link {{
+  }
+  .photo-card.selected .select-badge { display: block; }
+  .photo-card a.open-link {
     position: absolute; bottom: 52px; right: 8px; background: #ffffff22;
     color: #fff; font-size: 11px; padding: 4px 8px; border-radius: 6px;
     text-decoration: none; opacity: 0; transition: opacity 0.2s;
-  }}
-  .photo-card:hover a.open-link {{ opacity: 1; }}
-  .filter-bar {{ display: flex; gap: 8px; }}
-  .filter-bar button {{
+  }
+  .photo-card:hover a.open-link { opacity: 1; }
+  .filter-bar { display: flex; gap: 8px; }
+  .filter-bar button {
     background: #2a2a2a; color: #ccc; border: 1px solid #444;
     padding: 6px 14px; border-radius: 6px; cursor: pointer; font-size: 13px;
-  }}
-  .filter-bar button.active {{ background: #f59e0b; color: #000; border-color: #f59e0b; }}
+  }
+  .filter-bar button.active { background: #f59e0b; color: #000; border-color: #f59e0b; }
 </style>
 </head>
 <body>
-
-<div class="header">
-  <h1>📸 Duplicate Photo Report</h1>
-  <p class="stats">
-    Generated {datetime.now().strftime("%B %d, %Y at %I:%M %p")}<br>
-    <span>{len(duplicate_groups)}</span> duplicate groups &middot;
-    <span>{total_dupes}</span> potential duplicates to remove
-  </p>
-</div>
-
-<div class="controls">
-  <div class="filter-bar">
-    <button class="active" onclick="filterGroups('all')">All ({len(duplicate_groups)})</button>
-    <button onclick="filterGroups('exact')">Exact Matches</button>
-    <button onclick="filterGroups('similar')">Similar</button>
-  </div>
-  <div>
-    <span class="selected-count"><span id="selectedCount">0</span> selected for deletion</span>
-    &nbsp;
-    <button onclick="autoSelectDupes()">Auto-select duplicates (keep oldest)</button>
-    &nbsp;
-    <button class="danger" onclick="exportSelected()">Export Selection as JSON</button>
-  </div>
-</div>
-"""
-
-    for i, group in enumerate(duplicate_groups):
-        # Determine if exact match (all same MD5)
-        md5s = set(p["md5"] for p in group)
-        is_exact = len(md5s) == 1
-        badge_class = "exact" if is_exact else ""
-        badge_text = "Exact Match" if is_exact else "Similar"
-
-        html += f"""
-<div class="group" data-type="{'exact' if is_exact else 'similar'}">
-  <div class="group-header">
-    <h3>Group {i + 1} — {len(group)} photos</h3>
-    <span class="badge {badge_class}">{badge_text}</span>
-  </div>
-  <div class="photos">
-"""
-        for j, photo in enumerate(group):
-            created = photo.get("creation_time", "Unknown")[:10]
-            dims = f"{photo.get('width', '?')}×{photo.get('height', '?')}"
-            keep_class = "keep" if j == 0 else ""
-            keep_badge = '<span class="keep-badge">KEEP</span>' if j == 0 else ""
-            product_url = photo.get("product_url", "#")
-
-            html += f"""
-    <div class="photo-card {keep_class}"
-         data-id="{photo['id']}" data-group="{i}"
-         onclick="toggleSelect(this)">
-      {keep_badge}
-      <span class="select-badge">DELETE</span>
-      <a class="open-link" href="{product_url}" target="_blank"
-         onclick="event.stopPropagation()">Open ↗</a>
-      <img src="{photo.get('base_url', '')}=w300-h300-c"
-           alt="{photo.get('filename', '')}"
-           loading="lazy"
-           onerror="this.src='data:image/svg+xml,<svg xmlns=%22http://www.w3.org/2000/svg%22 viewBox=%220 0 300 300%22><rect fill=%22%23333%22 width=%22300%22 height=%22300%22/><text x=%2250%%25%22 y=%2250%%25%22 text-anchor=%22middle%22 fill=%22%23666%22 font-size=%2214%22>Expired</text></svg>'">
-      <div class="photo-meta">
-        <div class="filename">{photo.get('filename', 'Unknown')}</div>
-        <div class="details">{created} · {dims}</div>
-      </div>
-    </div>
 """
 
-        html += "  </div>\n</div>\n"
-
-    html += """
+_REPORT_TAIL = """
 <script>
 const selectedIds = new Set();
 
@@ -599,8 +1020,99 @@ function exportSelected() {
 </html>
 """
 
-    with open(report_path, "w") as f:
-        f.write(html)
+
+def _render_group(i: int, group: list) -> str:
+    """Render one duplicate group (a list of photo detail dicts) as HTML."""
+    # Determine if exact match (all same content hash)
+    md5s = set(p["md5"] for p in group)
+    is_exact = len(md5s) == 1
+    badge_class = "exact" if is_exact else ""
+    badge_text = "Exact Match" if is_exact else "Similar"
+
+    parts = [f"""
+<div class="group" data-type="{'exact' if is_exact else 'similar'}">
+  <div class="group-header">
+    <h3>Group {i + 1} — {len(group)} photos</h3>
+    <span class="badge {badge_class}">{badge_text}</span>
+  </div>
+  <div class="photos">
+"""]
+    for j, photo in enumerate(group):
+        created = photo.get("creation_time", "Unknown")[:10]
+        dims = f"{photo.get('width', '?')}×{photo.get('height', '?')}"
+        keep_class = "keep" if j == 0 else ""
+        keep_badge = '<span class="keep-badge">KEEP</span>' if j == 0 else ""
+        product_url = photo.get("product_url", "#")
+
+        parts.append(f"""
+    <div class="photo-card {keep_class}"
+         data-id="{photo['id']}" data-group="{i}"
+         onclick="toggleSelect(this)">
+      {keep_badge}
+      <span class="select-badge">DELETE</span>
+      <a class="open-link" href="{product_url}" target="_blank"
+         onclick="event.stopPropagation()">Open ↗</a>
+      <img src="{photo.get('base_url', '')}=w300-h300-c"
+           alt="{photo.get('filename', '')}"
+           loading="lazy"
+           onerror="this.src='data:image/svg+xml,<svg xmlns=%22http://www.w3.org/2000/svg%22 viewBox=%220 0 300 300%22><rect fill=%22%23333%22 width=%22300%22 height=%22300%22/><text x=%2250%%25%22 y=%2250%%25%22 text-anchor=%22middle%22 fill=%22%23666%22 font-size=%2214%22>Expired</text></svg>'">
+      <div class="photo-meta">
+        <div class="filename">{photo.get('filename', 'Unknown')}</div>
+        <div class="details">{created} · {dims}</div>
+      </div>
+    </div>
+""")
+
+    parts.append("  </div>\n</div>\n")
+    return "".join(parts)
+
+
+def generate_report(duplicate_groups: list, conn: sqlite3.Connection) -> Path:
+    """Generate an HTML report with side-by-side duplicate comparisons."""
+    REPORT_DIR.mkdir(exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = REPORT_DIR / f"duplicates_{timestamp}.html"
+
+    # Refresh base URLs (they expire after ~1hr)
+    # We'll use product_url links instead for the report
+    total_dupes = sum(len(g) - 1 for g in duplicate_groups)
+    details = load_photo_details(conn, [pid for group in duplicate_groups for pid in group])
+
+    # Streamed group by group: memory stays at one card instead of the whole page
+    with open(report_path, "w", buffering=1 << 20) as f:
+        f.write(_REPORT_HEAD)
+        f.write(f"<title>Google Photos Duplicate Report — {timestamp}</title>\n")
+        f.write(_REPORT_STYLE)
+        f.write(f"""
+<div class="header">
+  <h1>📸 Duplicate Photo Report</h1>
+  <p class="stats">
+    Generated {datetime.now().strftime("%B %d, %Y at %I:%M %p")}<br>
+    <span>{len(duplicate_groups)}</span> duplicate groups &middot;
+    <span>{total_dupes}</span> potential duplicates to remove
+  </p>
+</div>
+
+<div class="controls">
+  <div class="filter-bar">
+    <button class="active" onclick="filterGroups('all')">All ({len(duplicate_groups)})</button>
+    <button onclick="filterGroups('exact')">Exact Matches</button>
+    <button onclick="filterGroups('similar')">Similar</button>
+  </div>
+  <div>
+    <span class="selected-count"><span id="selectedCount">0</span> selected for deletion</span>
+    &nbsp;
+    <button onclick="autoSelectDupes()">Auto-select duplicates (keep oldest)</button>
+    &nbsp;
+    <button class="danger" onclick="exportSelected()">Export Selection as JSON</button>
+  </div>
+</div>
+""")
+
+        for i, group_ids in enumerate(duplicate_groups):
+            f.write(_render_group(i, [details[pid] for pid in group_ids]))
+
+        f.write(_REPORT_TAIL)
 
     logger.info(f"Report saved to {report_path}")
     return report_path
@@ -624,6 +1136,10 @@ def main():
         "--report-only", action="store_true",
         help="Skip scanning, just regenerate report from existing DB"
     )
+    parser.add_argument(
+        "--rehash", action="store_true",
+        help="Recompute hashes for stored photos from cached thumbnails (no API calls)"
+    )
     args = parser.parse_args()
 
     logger.info("=" * 60)
@@ -632,16 +1148,24 @@ def main():
 
     conn = init_db()
 
-    if not args.report_only:
+    photos = []
+    if args.rehash:
+        photos = cached_photo_items(conn)
+    elif not args.report_only:
         creds = authenticate()
         service = build("photoslibrary", "v1", credentials=creds, static_discovery=False)
 
         photos = list_all_photos(service, conn, full_scan=args.full_scan)
 
-        if photos:
-            scan_photos(photos, conn)
-        else:
-            logger.info("No new photos to scan.")
+    if photos:
+        # Rebuilding the indexes once afterwards is cheaper than updating them per row
+        drop_indexes(conn)
+        try:
+            scan_photos(photos, conn, replace=args.full_scan or args.rehash)
+        finally:
+            create_indexes(conn)
+    elif not args.report_only:
+        logger.info("No new photos to scan.")
 
     duplicate_groups = find_duplicates(conn, threshold=args.threshold)
 
@@ -6,7 +6,6 @@ Requires Chrome and ChromeDriver.
 """
 
 import json
-import time
 import sys
 
 from selenium import webdriver
@@ -14,11 +13,17 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
 from scanner import load_json, PHOTO_INDEX_PATH
 
+# "Move to trash" confirmation button. The aria-label CSS match is checked
+# first; the XPath text match only runs for builds that label it by text alone
+_TRASH_LOC = (By.CSS_SELECTOR, "button[aria-label*='trash' i]")
+_TRASH_TEXT_LOC = (By.XPATH, "//button[contains(., 'Move to trash') or contains(., 'Move to Trash')]")
+
 
 def load_delete_list(path="delete_list.json"):
     """Load the delete list exported from the HTML report."""
@@ -91,7 +96,7 @@ def delete_photos_interactive(delete_list_path="delete_list.json"):
             print(f"  URL: {product_url}")
 
             driver.get(product_url)
-            time.sleep(2)
+            WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
 
             action = input("  [Enter]=Delete  [s]=Skip  [q]=Quit: ").strip().lower()
 
@@ -108,19 +113,23 @@ def delete_photos_interactive(delete_list_path="delete_list.json"):
                     body = driver.find_element(By.TAG_NAME, "body")
                     # Google Photos uses '#' key to move to trash
                     body.send_keys("#")
-                    time.sleep(1)
 
                     # Look for the "Move to trash" confirmation button
                     try:
                         confirm_btn = WebDriverWait(driver, 5).until(
-                            EC.element_to_be_clickable(
-                                (By.XPATH, "//button[contains(., 'Move to trash') or contains(., 'Move to Trash')]")
+                            EC.any_of(
+                                EC.element_to_be_clickable(_TRASH_LOC),
+                                EC.element_to_be_clickable(_TRASH_TEXT_LOC),
                             )
                         )
                         confirm_btn.click()
                         deleted += 1
                         print(f"  ✓ Moved to trash")
-                        time.sleep(1)
+                        # Let the dialog close before navigating away
+                        try:
+                            WebDriverWait(driver, 5).until(EC.staleness_of(confirm_btn))
+                        except TimeoutException:
+                            pass
                     except Exception:
                         # Try alternative: click the three-dot menu → Delete
                         print("  ⚠ Auto-delete failed. Please delete manually in the browser.")
@@ -173,9 +182,8 @@ def batch_open_urls(delete_list_path="delete_list.json", batch_size=10):
             batch = urls[i : i + batch_size]
             print(f"\nBatch {i // batch_size + 1}: Opening {len(batch)} photos...")
 
-            for url in batch:
-                driver.execute_script(f"window.open('{url}', '_blank');")
-                time.sleep(0.5)
+            # One round trip for the whole batch
+            driver.execute_script("arguments[0].forEach(u => window.open(u, '_blank'));", batch)
 
             print(f"Delete unwanted photos in the browser tabs.")
             input(f"Press Enter when done with this batch...")
@@ -1,24 +1,344 @@
 """Find duplicate and similar images using perceptual hash comparison."""
 
 import json
+import math
+import multiprocessing
+import os
+import heapq
 from collections import defaultdict
-from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
 
-import imagehash
+import numpy as np
 
-from scanner import load_json, PHOTO_INDEX_PATH, HASH_DB_PATH
+from scanner import load_json, load_hash_db, PHOTO_INDEX_PATH, HASH_DB_PATH, DEFAULT_HASH_SIZE
+from hashes import hex_length
+
+try:
+    from numba import njit, prange
+    from numba.extending import intrinsic
+except ImportError:  # numba is optional; buckets are verified with NumPy instead
+    njit = None
 
 
 def hamming_distance(hash1_hex, hash2_hex):
     """Compute Hamming distance between two hex hash strings."""
     try:
-        h1 = imagehash.hex_to_hash(hash1_hex)
-        h2 = imagehash.hex_to_hash(hash2_hex)
-        return h1 - h2
+        return (int(hash1_hex, 16) ^ int(hash2_hex, 16)).bit_count()
     except Exception:
         return float("inf")
 
 
+def pack_hashes(hex_hashes):
+    """
+    Parse hex hash strings once into an (n, words) uint64 array, one row per
+    hash, so distances become an XOR plus a popcount.
+    """
+    width = max((len(h) for h in hex_hashes), default=16)
+    width = -(-width // 16) * 16  # Whole 64-bit words
+    raw = b"".join(bytes.fromhex(h.rjust(width, "0")) for h in hex_hashes)
+    return np.frombuffer(raw, dtype=">u8").astype(np.uint64).reshape(-1, width // 16)
+
+
+def load_packed_hashes(ids, hex_hashes, hash_type="phash"):
+    """
+    pack_hashes(hex_hashes), reusing the array cached next to HASH_DB_PATH
+    when it was built from the hash DB as it is now (same mtime_ns and size,
+    saved in the cache) and covers the same ids in the same order, so
+    repeated reports skip reparsing every hash.
+    """
+    cache_path = f"{HASH_DB_PATH}.{hash_type}.u64.npz"
+    try:
+        st = os.stat(HASH_DB_PATH)
+        db_stamp = np.array([st.st_mtime_ns, st.st_size], dtype=np.int64)
+    except OSError:
+        db_stamp = None
+    try:
+        if db_stamp is not None:
+            with np.load(cache_path) as cached:
+                if (np.array_equal(cached["db_stamp"], db_stamp)
+                        and cached["ids"].tolist() == ids):
+                    return cached["hashes"]
+    except (OSError, KeyError, ValueError):
+        pass  # No usable cache; rebuild it
+
+    hashes = pack_hashes(hex_hashes)
+    if db_stamp is not None:
+        tmp_path = cache_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, ids=np.array(ids, dtype=str), hashes=hashes, db_stamp=db_stamp)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # Only a cache
+    return hashes
+
+
+POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(x):
+    """Per-element bit count of a uint64 array."""
+    if hasattr(np, "bitwise_count"):  # NumPy 2.0+, POPCNT per element
+        return np.bitwise_count(x)
+    x = np.ascontiguousarray(x)
+    return POPCOUNT8[x.view(np.uint8)].reshape(*x.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+def pair_distances(hashes, a, b):
+    """Hamming distances between packed hash rows a[k] and b[k], for every k."""
+    return popcount(hashes[a] ^ hashes[b]).sum(axis=-1, dtype=np.int64)
+
+
+# Buckets larger than this are verified as a dense block, tile by tile, so a
+# tile of XORs (BLOCK_ROWS x BLOCK_ROWS hashes) stays within L2 cache
+BLOCK_ROWS = 256
+
+# Libraries at least this large verify index tables in worker processes, each
+# reading the packed hashes from shared memory; below it, starting the pool
+# costs more than it saves
+PARALLEL_MIN_IMAGES = 500_000
+
+
+# Multi-index hashing: the bits are split into at least threshold + 1
+# disjoint ranges (each at most 64 bits), and each index table keys every
+# hash on one range. By the pigeonhole principle two hashes at most
+# `threshold` bits apart agree exactly on at least one range, so they share
+# a bucket in some table: the search is exact, not sampled.
+def index_table_count(n_bits, threshold):
+    """Number of index tables (disjoint bit ranges) searched at `threshold`."""
+    if threshold >= n_bits:
+        return 1  # Every pair is close; one table with one bucket finds them
+    return max(threshold + 1, -(-n_bits // 64))
+
+
+def index_ranges(n_bits, threshold):
+    """The bit positions each index table keys on, in table order."""
+    if threshold >= n_bits:
+        return [np.arange(0)]
+    bounds = np.linspace(0, n_bits, index_table_count(n_bits, threshold) + 1).astype(int)
+    return [np.arange(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def index_buckets(hashes, threshold, ranges=None):
+    """
+    Yield one (members, offsets) pair per index table: the positions of every
+    hash that shares its bucket with another, grouped by bucket (CSR style),
+    with bucket b spanning members[offsets[b]:offsets[b + 1]] in ascending order.
+    `ranges` restricts this to those tables (from index_ranges).
+    """
+    n = len(hashes)
+    bits = np.unpackbits(np.ascontiguousarray(hashes).view(np.uint8), axis=1)
+    if ranges is None:
+        ranges = index_ranges(bits.shape[1], threshold)
+
+    for bit_range in ranges:
+        packed = np.zeros((n, 8), dtype=np.uint8)
+        signature = np.packbits(bits[:, bit_range], axis=1)
+        packed[:, :signature.shape[1]] = signature
+        keys = packed.view(np.uint64).ravel()
+
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, n])
+        shared = sizes > 1
+        members = order[np.repeat(shared, sizes)]
+        offsets = np.r_[0, np.cumsum(sizes[shared])]
+        yield members, offsets
+
+
+def _bucket_close_pairs_numpy(members, offsets, hashes, threshold):
+    # Ordered iteration instead of a per-bucket loop: step s pairs each member
+    # with the one s places after it in the same bucket, so every pair is
+    # produced exactly once across steps, with no set to dedupe against
+    bucket_end = np.repeat(offsets[1:], np.diff(offsets))
+    x = np.arange(len(members))
+    close = [np.empty((0, 2), dtype=np.int64)]
+    step = 1
+    while True:
+        x = x[x + step < bucket_end[x]]
+        if not len(x):
+            break
+        a, b = members[x], members[x + step]
+        keep = pair_distances(hashes, a, b) <= threshold
+        close.append(np.stack([a[keep], b[keep]], axis=1))
+        step += 1
+    return np.concatenate(close)
+
+
+def _block_close_pairs_numpy(block, threshold):
+    m = len(block)
+    close = [np.empty((0, 2), dtype=np.int64)]
+    for i0 in range(0, m, BLOCK_ROWS):
+        rows = block[i0:i0 + BLOCK_ROWS]
+        for j0 in range(i0, m, BLOCK_ROWS):
+            cols = block[j0:j0 + BLOCK_ROWS]
+            dist = popcount(rows[:, None, :] ^ cols[None, :, :]).sum(axis=-1)
+            i, j = np.nonzero(dist <= threshold)
+            i, j = i + i0, j + j0
+            keep = i < j
+            close.append(np.stack([i[keep], j[keep]], axis=1))
+    return np.concatenate(close)
+
+
+if njit is not None:
+    @intrinsic
+    def _popcount(typingctx, x):
+        """Lower to LLVM ctpop, which becomes POPCNT on x86-64 and CNT on ARM."""
+        def codegen(context, builder, signature, args):
+            return builder.ctpop(args[0])
+        return x(x), codegen
+
+    @njit(inline="always")
+    def _distance(hashes, a, b):
+        d = 0
+        for w in range(hashes.shape[1]):
+            d += _popcount(hashes[a, w] ^ hashes[b, w])
+        return d
+
+    @njit(cache=True, parallel=True)
+    def bucket_close_pairs(members, offsets, hashes, threshold):
+        """
+        Every (i, j) pair within `threshold` bits that shares a bucket of one
+        index table (CSR layout from index_buckets), with buckets spread over
+        threads. Pairs are counted first so each bucket writes its own slice.
+        """
+        n_buckets = len(offsets) - 1
+        counts = np.zeros(n_buckets, dtype=np.int64)
+        for b in prange(n_buckets):
+            for x in range(offsets[b], offsets[b + 1]):
+                for y in range(x + 1, offsets[b + 1]):
+                    if _distance(hashes, members[x], members[y]) <= threshold:
+                        counts[b] += 1
+
+        slots = np.zeros(n_buckets + 1, dtype=np.int64)
+        slots[1:] = np.cumsum(counts)
+        pairs = np.empty((slots[-1], 2), dtype=np.int64)
+        for b in prange(n_buckets):
+            k = slots[b]
+            for x in range(offsets[b], offsets[b + 1]):
+                for y in range(x + 1, offsets[b + 1]):
+                    if _distance(hashes, members[x], members[y]) <= threshold:
+                        pairs[k, 0] = members[x]
+                        pairs[k, 1] = members[y]
+                        k += 1
+        return pairs
+
+    @njit(cache=True)
+    def _scan_tile(block, threshold, t, out, k, write):
+        # Row tile t against itself and every later column tile; a column
+        # tile is reread for each row, so it is the one kept small enough
+        # to stay cached
+        m = len(block)
+        i_start, i_end = t * BLOCK_ROWS, min((t + 1) * BLOCK_ROWS, m)
+        for j0 in range(i_start, m, BLOCK_ROWS):
+            j_end = min(j0 + BLOCK_ROWS, m)
+            for i in range(i_start, i_end):
+                for j in range(max(j0, i + 1), j_end):
+                    if _distance(block, i, j) <= threshold:
+                        if write:
+                            out[k, 0] = i
+                            out[k, 1] = j
+                        k += 1
+        return k
+
+    @njit(cache=True, parallel=True)
+    def block_close_pairs(block, threshold):
+        """
+        Every (i, j) row pair of a contiguous hash block within `threshold`
+        bits, with row tiles spread over threads (counted first, as above).
+        """
+        n_tiles = (len(block) + BLOCK_ROWS - 1) // BLOCK_ROWS
+        none = np.empty((0, 2), dtype=np.int64)
+        counts = np.zeros(n_tiles, dtype=np.int64)
+        for t in prange(n_tiles):
+            counts[t] = _scan_tile(block, threshold, t, none, 0, False)
+
+        slots = np.zeros(n_tiles + 1, dtype=np.int64)
+        slots[1:] = np.cumsum(counts)
+        pairs = np.empty((slots[-1], 2), dtype=np.int64)
+        for t in prange(n_tiles):
+            _scan_tile(block, threshold, t, pairs, slots[t], True)
+        return pairs
+else:
+    bucket_close_pairs = _bucket_close_pairs_numpy
+    block_close_pairs = _block_close_pairs_numpy
+
+
+def table_close_pairs(members, offsets, hashes, threshold):
+    """
+    Every close pair within one index table's buckets (from index_buckets).
+    Small buckets are checked in place; each large one is gathered into a
+    contiguous block first, so its all-pairs scan streams through memory
+    instead of chasing member indices, and is tiled over threads.
+    """
+    sizes = np.diff(offsets)
+    large = sizes > BLOCK_ROWS
+    if not large.any():
+        return bucket_close_pairs(members, offsets, hashes, threshold)
+
+    small = np.repeat(~large, sizes)
+    close = [bucket_close_pairs(members[small], np.r_[0, np.cumsum(sizes[~large])],
+                                hashes, threshold)]
+    for b in np.flatnonzero(large):
+        bucket = members[offsets[b]:offsets[b + 1]]
+        local = block_close_pairs(np.ascontiguousarray(hashes[bucket]), threshold)
+        close.append(bucket[local])
+    return np.concatenate(close)
+
+
+def _init_worker(threads):
+    if njit is not None:
+        import numba
+        numba.set_num_threads(threads)  # Share the cores instead of each worker taking all
+
+
+def _shard_close_pairs(shm_name, shape, ranges, threshold):
+    """Worker side of index_close_pairs: every close pair from a shard of tables."""
+    shm = SharedMemory(name=shm_name)
+    try:
+        hashes = np.ndarray(shape, dtype=np.uint64, buffer=shm.buf)
+        close = [table_close_pairs(members, offsets, hashes, threshold)
+                 for members, offsets in index_buckets(hashes, threshold, ranges)]
+        del hashes  # The buffer can't be closed while an array still views it
+    finally:
+        shm.close()
+    return np.concatenate(close)
+
+
+def index_close_pairs(hashes, threshold, workers=None):
+    """
+    Yield the close pairs found by each index table, or by each shard of tables
+    when the library is large enough to spread them over worker processes.
+    Pairs can repeat across yields.
+    """
+    ranges = index_ranges(hashes.shape[1] * 64, threshold)
+    workers = min(workers or os.cpu_count() or 1, len(ranges))
+    if workers < 2 or len(hashes) < PARALLEL_MIN_IMAGES:
+        for members, offsets in index_buckets(hashes, threshold, ranges):
+            yield table_close_pairs(members, offsets, hashes, threshold)
+        return
+
+    shm = SharedMemory(create=True, size=hashes.nbytes)
+    try:
+        np.ndarray(hashes.shape, dtype=np.uint64, buffer=shm.buf)[:] = hashes
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        # Spawned rather than forked: forking after numba has started its
+        # thread pool in this process can deadlock
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(threads,)) as pool:
+            # Tables are dealt round-robin, so each shard gets a similar share
+            shards = [pool.submit(_shard_close_pairs, shm.name, hashes.shape,
+                                  ranges[w::workers], threshold)
+                      for w in range(workers)]
+            for shard in shards:
+                yield shard.result()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
 def find_exact_duplicates(hash_db):
     """
     Find exact duplicates by MD5 hash.
@@ -26,29 +346,48 @@ def find_exact_duplicates(hash_db):
     Returns:
         List of groups, each group is a list of item IDs sharing the same MD5.
     """
-    md5_groups = defaultdict(list)
-    
+    ids = []
+    md5s = []
     for item_id, hashes in hash_db.items():
         md5 = hashes.get("md5")
         if md5:
-            md5_groups[md5].append(item_id)
+            ids.append(item_id)
+            md5s.append(md5)
+    if not ids:
+        return []
 
-    # Only return groups with 2+ items
-    return [group for group in md5_groups.values() if len(group) > 1]
+    # Sort once and split where the hash changes, instead of hashing every
+    # 32-char string into a dict
+    md5s = np.array(md5s, dtype="S")
+    order = np.argsort(md5s, kind="stable")
+    sorted_md5s = md5s[order]
+    starts = np.flatnonzero(np.r_[True, sorted_md5s[1:] != sorted_md5s[:-1]])
+    ends = np.r_[starts[1:], len(order)]
 
+    # Only return groups with 2+ items, in order of first appearance
+    dupes = ends - starts > 1
+    starts, ends = starts[dupes], ends[dupes]
+    first_seen = np.argsort(order[starts], kind="stable")
+    starts, ends = starts[first_seen].tolist(), ends[first_seen].tolist()
+    sorted_ids = [ids[i] for i in order.tolist()]
+    return [sorted_ids[start:end] for start, end in zip(starts, ends)]
 
-def find_similar_images(hash_db, threshold=6, hash_type="phash"):
+
+def find_similar_images(hash_db, threshold=6, hash_type="phash", top_k=None, hash_size=None):
     """
     Find similar images using perceptual hash comparison.
     
     Uses a bucket-based approach for efficiency with large libraries:
     1. Group by exact hash (distance 0)
-    2. For remaining, compare within nearby buckets
+    2. For remaining, compare within shared multi-index buckets
     
     Args:
         hash_db: Dict of item_id -> hash dict
         threshold: Max Hamming distance to consider similar
         hash_type: Which hash to use ('phash' or 'dhash')
+        top_k: If set, only return the top_k largest groups
+        hash_size: If set, only hashes of this size are compared; others
+            are left out until a scan rehashes them
     
     Returns:
         List of groups, where each group is a list of (item_id, distance_to_anchor) tuples.
@@ -56,34 +395,53 @@ def find_similar_images(hash_db, threshold=6, hash_type="phash"):
     # Step 1: Group by exact perceptual hash
     exact_groups = defaultdict(list)
     items_with_hashes = []
+    hash_len = hex_length(hash_size) if hash_size else None
+    skipped = 0
     
     for item_id, hashes in hash_db.items():
         h = hashes.get(hash_type)
         if h and "error" not in hashes:
-            exact_groups[h].append(item_id)
+            if hash_len and len(h) != hash_len:
+                skipped += 1
+                continue
+            exact_groups[h].append(len(items_with_hashes))
             items_with_hashes.append((item_id, h))
 
-    # Step 2: For efficiency with 50k+ images, use prefix bucketing
-    # Group hashes by their first 4 hex chars and compare within/across nearby buckets
-    prefix_buckets = defaultdict(list)
-    for item_id, h in items_with_hashes:
-        # Use first 4 chars as bucket key
-        prefix = h[:4]
-        prefix_buckets[prefix].append((item_id, h))
+    if skipped:
+        print(f"  Skipping {skipped} images hashed at a different hash_size; run 'scan' to rehash them")
+
+    ids = [item_id for item_id, _ in items_with_hashes]
+
+    # At threshold 0 the exact groups are the answer; skip bucketing entirely
+    if threshold == 0:
+        dup_groups = [[ids[i] for i in group] for group in exact_groups.values() if len(group) > 1]
+        return _largest_groups(dup_groups, top_k)
+
+    # Parse every hash once; everything below works on positions into `hashes`
+    hashes = load_packed_hashes(ids, [h for _, h in items_with_hashes], hash_type)
+    n = len(ids)
+
+    # Union-Find for grouping, over positions rather than id strings
+    parent = np.arange(n, dtype=np.int32)
+    size = np.ones(n, dtype=np.int32)
 
-    # Union-Find for grouping
-    parent = {}
-    
     def find(x):
-        while parent.get(x, x) != x:
-            parent[x] = parent.get(parent[x], parent[x])
-            x = parent[x]
-        return x
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        # Second pass: point every node on the path straight at the root
+        while x != root:
+            parent[x], x = root, parent[x]
+        return root
 
     def union(x, y):
         rx, ry = find(x), find(y)
-        if rx != ry:
-            parent[rx] = ry
+        if rx == ry:
+            return
+        if size[rx] < size[ry]:
+            rx, ry = ry, rx
+        parent[ry] = rx  # Smaller tree under the larger one
+        size[rx] += size[ry]
 
     # Compare within exact groups first
     for h, group in exact_groups.items():
@@ -91,56 +449,54 @@ def find_similar_images(hash_db, threshold=6, hash_type="phash"):
             for i in range(1, len(group)):
                 union(group[0], group[i])
 
-    # Compare across prefix buckets for near-matches
-    # This is O(n * bucket_size) instead of O(n^2)
-    seen_pairs = set()
-    all_prefixes = sorted(prefix_buckets.keys())
-    
-    print(f"Comparing {len(items_with_hashes)} images across {len(all_prefixes)} hash buckets...")
-    
-    for i, prefix in enumerate(all_prefixes):
-        bucket = prefix_buckets[prefix]
-        
-        # Compare within this bucket
-        for j in range(len(bucket)):
-            for k in range(j + 1, len(bucket)):
-                id_j, h_j = bucket[j]
-                id_k, h_k = bucket[k]
-                pair = tuple(sorted([id_j, id_k]))
-                if pair not in seen_pairs:
-                    seen_pairs.add(pair)
-                    dist = hamming_distance(h_j, h_k)
-                    if dist <= threshold:
-                        union(id_j, id_k)
-
-        # Compare with neighboring prefixes (handles boundary cases)
-        for other_prefix in all_prefixes[i + 1 : i + 3]:
-            other_bucket = prefix_buckets[other_prefix]
-            for id_j, h_j in bucket:
-                for id_k, h_k in other_bucket:
-                    pair = tuple(sorted([id_j, id_k]))
-                    if pair not in seen_pairs:
-                        seen_pairs.add(pair)
-                        dist = hamming_distance(h_j, h_k)
-                        if dist <= threshold:
-                            union(id_j, id_k)
+    # Step 2: For efficiency with 50k+ images, only compare hashes that agree
+    # exactly on one of the index tables' bit ranges. Unlike a single hash
+    # prefix, the ranges cover every bit, so no near-duplicate is missed.
+    # Identical hashes are already joined, so each distinct hash goes in once
+    # (its first image standing in for the rest) rather than every copy
+    # colliding with every other in every table
+    reps = np.array([group[0] for group in exact_groups.values()], dtype=np.int64)
+    n_tables = index_table_count(hashes.shape[1] * 64, threshold)
+    print(f"Comparing {len(reps)} distinct hashes of {n} images across {n_tables} index tables...")
+
+    # A close pair usually turns up in several tables. Each is packed into
+    # one int64 key, (low << 32) | high, so repeats are dropped with sorted
+    # array set operations instead of costing a Python union each; only the
+    # distinct close pairs are kept, not any table's candidates
+    if len(reps) > 1:
+        seen = np.empty(0, dtype=np.int64)
+        for pairs in index_close_pairs(hashes[reps], threshold):
+            pairs = reps[pairs]
+            low, high = pairs.min(axis=1), pairs.max(axis=1)
+            keys = np.unique((low << 32) | high)
+            keys = keys[~np.isin(keys, seen, assume_unique=True)]
+            seen = np.union1d(seen, keys)
+            for key in keys.tolist():
+                union(key >> 32, key & 0xFFFFFFFF)
 
     # Collect groups
     groups = defaultdict(list)
-    for item_id, h in items_with_hashes:
-        root = find(item_id)
-        groups[root].append(item_id)
+    for i in range(n):
+        groups[find(i)].append(ids[i])
 
     # Return only groups with duplicates, sorted by size
-    dup_groups = [g for g in groups.values() if len(g) > 1]
+    return _largest_groups([g for g in groups.values() if len(g) > 1], top_k)
+
+
+def _largest_groups(dup_groups, top_k=None):
+    if top_k is not None:
+        return heapq.nlargest(top_k, dup_groups, key=len)  # O(G log k), same order
     dup_groups.sort(key=len, reverse=True)
-    
     return dup_groups
 
 
-def find_all_duplicates(threshold=6, config=None):
+def find_all_duplicates(threshold=6, config=None, hash_db=None, photo_index=None, top_k=None):
     """
     Run all duplicate detection methods and merge results.
+
+    Pass `hash_db` / `photo_index` when they are already in memory (e.g.
+    straight from scan_library) to skip re-reading them from disk. With
+    `top_k`, only the first top_k groups in report order are returned.
     
     Returns:
         List of duplicate groups with metadata.
@@ -148,8 +504,10 @@ def find_all_duplicates(threshold=6, config=None):
     if config is None:
         config = load_json("config.json", {})
 
-    hash_db = load_json(HASH_DB_PATH, {})
-    photo_index = load_json(PHOTO_INDEX_PATH, {})
+    if hash_db is None:
+        hash_db = load_hash_db()
+    if photo_index is None:
+        photo_index = load_json(PHOTO_INDEX_PATH, {})
 
     if not hash_db:
         print("No hash data found. Run 'scan' first.")
@@ -165,64 +523,95 @@ def find_all_duplicates(threshold=6, config=None):
     print(f"  Found {len(exact_groups)} groups of exact duplicates")
 
     # Find similar images
-    similar_groups = find_similar_images(hash_db, threshold=threshold)
+    similar_groups = find_similar_images(
+        hash_db, threshold=threshold, hash_size=config.get("hash_size", DEFAULT_HASH_SIZE)
+    )
     print(f"  Found {len(similar_groups)} groups of similar images")
 
     # Merge (similar_groups already includes exact matches via union-find)
-    # Enrich with metadata
-    result_groups = []
+    # Enrich with metadata in one pass over every flagged photo, groups laid
+    # out back to back, then work column-wise (structure of arrays): the
+    # per-item dicts are only built for the groups actually returned
+    sizes = np.array([len(g) for g in similar_groups], dtype=np.int64)
+    starts = np.cumsum(sizes) - sizes
+    group_of = np.repeat(np.arange(len(sizes)), sizes)
+
+    no_record = {}
+    rows = []
     for group_ids in similar_groups:
-        group = []
         for item_id in group_ids:
-            info = photo_index.get(item_id, {})
-            hashes = hash_db.get(item_id, {})
-            group.append({
-                "id": item_id,
-                "filename": info.get("filename", "unknown"),
-                "creationTime": info.get("creationTime", ""),
-                "productUrl": info.get("productUrl", ""),
-                "width": info.get("width", ""),
-                "height": info.get("height", ""),
-                "phash": hashes.get("phash", ""),
-                "md5": hashes.get("md5", ""),
-            })
-
-        # Sort by creation time
-        group.sort(key=lambda x: x.get("creationTime", ""))
-
-        # Mark which to keep vs delete
-        if keep_strategy == "oldest":
-            keep_idx = 0
-        else:
-            keep_idx = len(group) - 1
-
-        for i, item in enumerate(group):
-            item["action"] = "keep" if i == keep_idx else "delete"
-
-        # Compute pairwise distances for the group
-        if len(group) <= 10:  # Only for small groups
-            distances = {}
-            for i, j in combinations(range(len(group)), 2):
-                h1 = group[i].get("phash", "")
-                h2 = group[j].get("phash", "")
-                if h1 and h2:
-                    distances[f"{i}-{j}"] = hamming_distance(h1, h2)
-            group_info = {"max_distance": max(distances.values()) if distances else 0}
-        else:
-            group_info = {"max_distance": "N/A (large group)"}
-
+            info = photo_index.get(item_id, no_record)
+            hashes = hash_db.get(item_id, no_record)
+            rows.append((
+                item_id,
+                info.get("filename", "unknown"),
+                info.get("creationTime", ""),
+                info.get("productUrl", ""),
+                info.get("width", ""),
+                info.get("height", ""),
+                hashes.get("phash", ""),
+                hashes.get("md5", ""),
+            ))
+    creation_times = np.array([row[2] for row in rows], dtype=str)
+
+    # Sort each group by creation time: one stable sort keyed on group first
+    order = np.lexsort((creation_times, group_of)).tolist()
+    rows = [rows[i] for i in order]
+    phashes = [row[6] for row in rows]
+    md5 = np.array([row[7] for row in rows], dtype=str)
+
+    # Exact if every member with an md5 matches the first (which must have one).
+    # Every download records one; only entries from older scans may lack it
+    if len(sizes):
+        md5_0 = md5[starts]
+        same = (md5 == md5_0[group_of]) | (md5 == "")
+        is_exact = (md5_0 != "") & np.logical_and.reduceat(same, starts)
+    else:
+        is_exact = np.zeros(0, dtype=bool)
+
+    # Compute pairwise distances, only for small groups, all at once: step s
+    # pairs each member with the one s places after it in the same group
+    small = sizes <= 10
+    has_phash = np.array([bool(h) for h in phashes], dtype=bool)
+    packed = pack_hashes(phashes)  # Missing phashes pack as zeros, masked out below
+    group_end = np.repeat(starts + sizes, sizes)
+    max_distance = np.zeros(len(sizes), dtype=np.int64)
+    x = np.flatnonzero(np.repeat(small, sizes) & has_phash)
+    step = 1
+    while len(x):
+        x = x[x + step < group_end[x]]
+        y = x + step
+        a, b = x[has_phash[y]], y[has_phash[y]]
+        np.maximum.at(max_distance, group_of[a], pair_distances(packed, a, b))
+        step += 1
+
+    # Sort: exact dupes first, then by group size (reverse sorts stay stable)
+    rank = list(zip(is_exact.tolist(), sizes.tolist()))
+    if top_k is not None:
+        ranked = heapq.nlargest(top_k, range(len(rank)), key=rank.__getitem__)
+    else:
+        ranked = sorted(range(len(rank)), key=rank.__getitem__, reverse=True)
+
+    # Back to one dict per item (array of structures) for the report and JSON
+    keep_idx = 0 if keep_strategy == "oldest" else -1
+    result_groups = []
+    for g in ranked:
+        start, size = int(starts[g]), int(sizes[g])
+        items = [
+            {"id": item_id, "filename": filename, "creationTime": created,
+             "productUrl": url, "width": width, "height": height,
+             "phash": phash, "md5": md5_hex, "action": "delete"}
+            for item_id, filename, created, url, width, height, phash, md5_hex
+            in rows[start:start + size]
+        ]
+        items[keep_idx]["action"] = "keep"
         result_groups.append({
-            "items": group,
-            "size": len(group),
-            "is_exact": all(
-                g.get("md5") == group[0].get("md5") for g in group if g.get("md5")
-            ),
-            **group_info,
+            "items": items,
+            "size": size,
+            "is_exact": bool(is_exact[g]),
+            "max_distance": int(max_distance[g]) if small[g] else "N/A (large group)",
         })
 
-    # Sort: exact dupes first, then by group size
-    result_groups.sort(key=lambda g: (not g["is_exact"], -g["size"]))
-
     print(f"\nTotal: {len(result_groups)} duplicate groups, "
           f"{sum(g['size'] - 1 for g in result_groups)} photos flagged for deletion")
 
@@ -28,10 +28,11 @@ def cmd_scan(args):
 def cmd_report(args):
     """Find duplicates and generate HTML report."""
     config = load_json("config.json", {})
-    groups = find_all_duplicates(config=config)
+    groups = find_all_duplicates(config=config, top_k=args.top)
     
     output_path = args.output or config.get("report_path", "report.html")
-    generate_report(groups, output_path=output_path)
+    generate_report(groups, output_path=output_path,
+                    embed_thumbnails=config.get("embed_thumbnails", False))
 
 
 def cmd_delete(args):
@@ -52,13 +53,15 @@ def cmd_run(args):
     print("=" * 60)
     print("  Step 1: Scanning Google Photos Library")
     print("=" * 60)
-    scan_library(days=args.days, config=config)
+    photo_index, hash_db = scan_library(days=args.days, config=config)
 
     # Step 2: Find duplicates
     print("\n" + "=" * 60)
     print("  Step 2: Finding Duplicates")
     print("=" * 60)
-    groups = find_all_duplicates(config=config)
+    groups = find_all_duplicates(
+        config=config, hash_db=hash_db, photo_index=photo_index, top_k=args.top
+    )
 
     if not groups:
         print("\n✨ No duplicates found!")
@@ -69,7 +72,8 @@ def cmd_run(args):
     print("  Step 3: Generating Report")
     print("=" * 60)
     output_path = config.get("report_path", "report.html")
-    generate_report(groups, output_path=output_path)
+    generate_report(groups, output_path=output_path,
+                    embed_thumbnails=config.get("embed_thumbnails", False))
 
     print(f"\n✅ Done! Open {output_path} in your browser to review duplicates.")
 
@@ -95,6 +99,10 @@ def main():
         "--output", "-o", default=None,
         help="Output path for HTML report"
     )
+    report_parser.add_argument(
+        "--top", type=int, default=None,
+        help="Only report the first N groups (exact matches, then largest)"
+    )
 
     # delete
     delete_parser = subparsers.add_parser("delete", help="Deletion helper")
@@ -117,6 +125,10 @@ def main():
         "--days", type=int, default=None,
         help="Only scan photos from the last N days"
     )
+    run_parser.add_argument(
+        "--top", type=int, default=None,
+        help="Only report the first N groups (exact matches, then largest)"
+    )
 
     args = parser.parse_args()
 
@@ -2,24 +2,98 @@
 
 import os
 import io
-import json
 import hashlib
 import time
+import asyncio
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import httpx
+import orjson
 import requests
-import imagehash
-from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from PIL import Image, ImageOps
 from tqdm import tqdm
 
 from auth import get_authenticated_service, get_photos_api_url
+from hashes import phash_batch, dhash_batch, hex_length
 
 DATA_DIR = "data"
 PHOTO_INDEX_PATH = os.path.join(DATA_DIR, "photo_index.json")
-HASH_DB_PATH = os.path.join(DATA_DIR, "hash_db.json")
+HASH_DB_PATH = os.path.join(DATA_DIR, "hash_db.jsonl")
+LEGACY_HASH_DB_PATH = os.path.join(DATA_DIR, "hash_db.json")  # Before the JSONL log
 THUMBNAILS_DIR = os.path.join(DATA_DIR, "thumbnails")
 
+# Thumbnails are stored at the size the report shows them (cropped like its
+# object-fit: cover), as WebP; scans before this saved 256px JPEGs
+THUMBNAIL_DISPLAY_SIZE = (220, 180)
+
+# Library API calls share one keep-alive connection pool instead of a fresh
+# TLS handshake per page; transient 5xx responses are retried with backoff
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=None,  # mediaItems:search is a read, safe to retry
+    ),
+))
+
+# Library API pages are requested no faster than Google's per-user QPS
+# limit; a 429 waits out its Retry-After and tries again
+API_MIN_INTERVAL = 1 / 50
+API_MAX_RATE_LIMIT_RETRIES = 5
+
+# Thumbnails are hashed in batches this size, one vectorized DCT per batch
+HASH_BATCH_SIZE = 64
+
+# 8x8 (64-bit) hashes, the size perceptual dedup thresholds are usually
+# tuned for; config.json's hash_size overrides it
+DEFAULT_HASH_SIZE = 8
+
+# Worker threads for decoding, saving and hashing thumbnails, kept for the
+# life of the process so repeated scans don't spawn and warm up new ones
+_EXECUTOR = None
+
+
+def _get_executor(max_workers):
+    """The shared worker pool, recreated only when its size changes."""
+    global _EXECUTOR
+    if _EXECUTOR is None or _EXECUTOR._max_workers != max_workers:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=False)
+        _EXECUTOR = ThreadPoolExecutor(max_workers=max_workers)
+    return _EXECUTOR
+
+
+@atexit.register
+def _shutdown_executor():
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown()
+
+
+def thumbnail_path(item_id, ext="webp"):
+    """Path of an item's stored thumbnail."""
+    return os.path.join(THUMBNAILS_DIR, f"{item_id}.{ext}")
+
+
+def cached_thumbnail_ids(ext="webp"):
+    """
+    Ids of every stored thumbnail with this extension, from one directory
+    scan rather than a stat per item.
+    """
+    suffix = f".{ext}"
+    try:
+        with os.scandir(THUMBNAILS_DIR) as entries:
+            return {e.name[:-len(suffix)] for e in entries if e.name.endswith(suffix)}
+    except FileNotFoundError:
+        return set()
+
 
 def ensure_dirs():
     """Create data directories if they don't exist."""
@@ -30,15 +104,78 @@ def ensure_dirs():
 def load_json(path, default=None):
     """Load JSON file or return default."""
     if os.path.exists(path):
-        with open(path, "r") as f:
-            return json.load(f)
+        # orjson parses from bytes several times faster than the json module
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
     return default if default is not None else {}
 
 
 def save_json(path, data):
     """Save data as JSON."""
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2, default=str)
+    # Compact orjson output: far faster than json.dump(indent=2) on the large
+    # hash DB and about a third of the size (pipe through jq to read it)
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(
+            data,
+            default=str,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        ))
+
+
+def load_hash_db(path=HASH_DB_PATH):
+    """
+    Load the hash DB, an append-only JSONL log of {"id": ..., **hashes}
+    records where later lines win. A hash_db.json from older versions is
+    converted on first load.
+    """
+    if not os.path.exists(path):
+        hash_db = load_json(LEGACY_HASH_DB_PATH, {})
+        if hash_db:
+            rewrite_jsonl(hash_db, path)
+        return hash_db
+
+    hash_db = {}
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue  # Torn last line from an interrupted scan
+            hash_db[record.pop("id")] = record
+    return hash_db
+
+
+def open_hash_db_log(path=HASH_DB_PATH):
+    """Open the hash DB for appending records with append_hash_record()."""
+    f = open(path, "ab+", buffering=1 << 16)
+    # Start on a fresh line if an interrupted scan left a torn one
+    if f.tell():
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+    return f
+
+
+def append_hash_record(f, item_id, hashes):
+    """Append one item's hashes to an open hash DB log."""
+    f.write(orjson.dumps({"id": item_id, **hashes}) + b"\n")
+
+
+def rewrite_jsonl(hash_db, path=HASH_DB_PATH):
+    """Rewrite the hash DB log with one line per item, dropping superseded lines."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for item_id, hashes in hash_db.items():
+            append_hash_record(f, item_id, hashes)
+    os.replace(tmp_path, path)
+
+
+def _retry_after(resp, default=1.0):
+    """Seconds to wait before retrying a throttled response."""
+    try:
+        return max(float(resp.headers.get("Retry-After", default)), 0.0)
+    except ValueError:  # An HTTP date rather than seconds
+        return default
 
 
 def fetch_all_media_items(creds, days=None, progress_callback=None):
@@ -59,6 +196,7 @@ def fetch_all_media_items(creds, days=None, progress_callback=None):
     all_items = []
     page_token = None
     page_count = 0
+    last_request = 0.0
 
     # Build request body
     body = {"pageSize": 100}
@@ -87,11 +225,20 @@ def fetch_all_media_items(creds, days=None, progress_callback=None):
         if page_token:
             body["pageToken"] = page_token
 
-        resp = requests.post(
-            f"{base_url}/mediaItems:search",
-            headers=headers,
-            json=body,
-        )
+        for _ in range(API_MAX_RATE_LIMIT_RETRIES + 1):
+            wait = last_request + API_MIN_INTERVAL - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            last_request = time.monotonic()
+
+            resp = _session.post(
+                f"{base_url}/mediaItems:search",
+                headers=headers,
+                json=body,
+            )
+            if resp.status_code != 429:
+                break
+            time.sleep(_retry_after(resp))
         resp.raise_for_status()
         data = resp.json()
 
@@ -111,51 +258,110 @@ def fetch_all_media_items(creds, days=None, progress_callback=None):
         if not page_token:
             break
 
-        # Rate limiting
-        time.sleep(0.1)
-
     return all_items
 
 
-def download_thumbnail(item, creds, size=256):
+def _decode_and_store(content, thumb_path, store=True):
+    img = Image.open(io.BytesIO(content))
+    # Google serves JPEGs, which already decode as RGB; convert() would copy
+    # every pixel for nothing, so only other formats go through it
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    # Hashes come from the full download; only the stored copy is shrunk
+    if store:
+        thumb = ImageOps.fit(img, THUMBNAIL_DISPLAY_SIZE, Image.LANCZOS)
+        thumb.save(thumb_path, "WEBP", quality=80, method=4)
+    return img
+
+
+async def adownload_thumbnail(item, client, size=256, executor=None, cached=None):
     """
-    Download a thumbnail for a media item.
+    Download a thumbnail for a media item over a shared httpx.AsyncClient.
+    Decoding and saving run on executor (the loop's default if None) so the
+    event loop keeps other downloads moving. `cached` is the set of ids with
+    a stored thumbnail (see cached_thumbnail_ids); None checks the file.
+
+    The stored thumbnail is a cropped, recompressed copy for the report, so
+    it is never hashed: the image is always downloaded, and a cached
+    thumbnail only saves encoding it again.
     
     Returns:
-        (item_id, PIL.Image) or (item_id, None) on failure
+        (item_id, PIL.Image, md5 of the downloaded bytes), with None for both
+        on failure
     """
     item_id = item["id"]
-    thumb_path = os.path.join(THUMBNAILS_DIR, f"{item_id}.jpg")
-
-    # Use cached thumbnail if exists
-    if os.path.exists(thumb_path):
-        try:
-            return item_id, Image.open(thumb_path)
-        except Exception:
-            pass
+    thumb_path = thumbnail_path(item_id)
+    loop = asyncio.get_running_loop()
+    store = not (item_id in cached if cached is not None else os.path.exists(thumb_path))
 
     try:
         url = f"{item['baseUrl']}=w{size}-h{size}"
-        resp = requests.get(url, timeout=30)
+        resp = await client.get(url, timeout=30)
         resp.raise_for_status()
-        img = Image.open(io.BytesIO(resp.content)).convert("RGB")
-        img.save(thumb_path, "JPEG", quality=85)
-        return item_id, img
+        img = await loop.run_in_executor(
+            executor, _decode_and_store, resp.content, thumb_path, store
+        )
+        return item_id, img, hashlib.md5(resp.content).hexdigest()
     except Exception as e:
-        return item_id, None
+        return item_id, None, None
+
+
+async def _download_thumbnails(items, size, max_workers, on_result, executor=None):
+    """
+    Download thumbnails for all items, multiplexed over HTTP/2 connections,
+    with at most max_workers requests in flight. Awaits on_result() for each
+    (item_id, img, md5) as it completes.
+    """
+    limit = asyncio.Semaphore(max_workers)
+    cached = cached_thumbnail_ids()
+
+    async def fetch(item):
+        async with limit:
+            return await adownload_thumbnail(item, client, size, executor, cached)
+
+    limits = httpx.Limits(max_connections=64, max_keepalive_connections=64)
+    async with httpx.AsyncClient(http2=True, limits=limits) as client:
+        for next_result in asyncio.as_completed([fetch(item) for item in items]):
+            await on_result(await next_result)
 
 
-def compute_hashes(img):
+def compute_hashes(img, hash_size=DEFAULT_HASH_SIZE):
     """
     Compute multiple perceptual hashes for an image.
     
     Returns:
         dict with hash type -> hash string
     """
+    return compute_hashes_batch([img], hash_size)[0]
+
+
+def compute_hashes_batch(images, hash_size=DEFAULT_HASH_SIZE):
+    """
+    Compute the perceptual hashes of several images at once.
+    
+    Returns:
+        list of dicts with hash type -> hash string, in input order
+    """
+    # Both hashes start by converting to grayscale; do it once for both
+    grays = [img.convert("L") for img in images]
+    return [
+        {"phash": p, "dhash": d}
+        for p, d in zip(phash_batch(grays, hash_size), dhash_batch(grays, hash_size))
+    ]
+
+
+def _index_record(item):
+    """Photo index entry for a media item from the API."""
+    metadata = item.get("mediaMetadata", {})
     return {
-        "phash": str(imagehash.phash(img, hash_size=16)),
-        "dhash": str(imagehash.dhash(img, hash_size=16)),
-        "md5": hashlib.md5(img.tobytes()).hexdigest(),
+        "id": item["id"],
+        "filename": item.get("filename", "unknown"),
+        "mimeType": item.get("mimeType", ""),
+        "creationTime": metadata.get("creationTime", ""),
+        "baseUrl": item.get("baseUrl", ""),
+        "productUrl": item.get("productUrl", ""),
+        "width": metadata.get("width", ""),
+        "height": metadata.get("height", ""),
     }
 
 
@@ -177,10 +383,11 @@ def scan_library(days=None, config=None):
     
     max_workers = config.get("max_concurrent_downloads", 10)
     thumb_size = config.get("thumbnail_size", 256)
+    hash_size = config.get("hash_size", DEFAULT_HASH_SIZE)
 
     # Load existing data for incremental scanning
     photo_index = load_json(PHOTO_INDEX_PATH, {})
-    hash_db = load_json(HASH_DB_PATH, {})
+    hash_db = load_hash_db()
 
     # Authenticate
     print("Authenticating...")
@@ -199,45 +406,73 @@ def scan_library(days=None, config=None):
     new_items = [item for item in items if item["id"] not in hash_db]
     print(f"  {len(new_items)} new images to process.")
 
+    # Images hashed at another hash_size are downloaded and rehashed, so
+    # every hash in the DB stays comparable (the stored thumbnail is a crop)
+    hash_len = hex_length(hash_size)
+    rehash_items = [
+        item for item in items
+        if item["id"] in hash_db
+        and "error" not in hash_db[item["id"]]
+        and len(hash_db[item["id"]].get("phash", "")) != hash_len
+    ]
+    if rehash_items:
+        print(f"  {len(rehash_items)} images to rehash at hash_size={hash_size}.")
+        new_items += rehash_items
+
+    # Update photo index: only new items and ones whose metadata changed
+    # (baseUrls expire, so refetched items usually differ there)
+    index_changed = False
+    for item in items:
+        record = _index_record(item)
+        if photo_index.get(item["id"]) != record:
+            photo_index[item["id"]] = record
+            index_changed = True
+
     if not new_items:
         print("No new images to process.")
+        if index_changed:
+            save_json(PHOTO_INDEX_PATH, photo_index)
         return photo_index, hash_db
 
-    # Update photo index
-    for item in items:
-        photo_index[item["id"]] = {
-            "id": item["id"],
-            "filename": item.get("filename", "unknown"),
-            "mimeType": item.get("mimeType", ""),
-            "creationTime": item.get("mediaMetadata", {}).get("creationTime", ""),
-            "baseUrl": item.get("baseUrl", ""),
-            "productUrl": item.get("productUrl", ""),
-            "width": item.get("mediaMetadata", {}).get("width", ""),
-            "height": item.get("mediaMetadata", {}).get("height", ""),
-        }
-
     # Download thumbnails and compute hashes
     print("Downloading thumbnails and computing hashes...")
     
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(download_thumbnail, item, creds, thumb_size): item
-            for item in new_items
-        }
-
-        with tqdm(total=len(new_items), desc="Processing") as pbar:
-            for future in as_completed(futures):
-                item_id, img = future.result()
-                if img is not None:
-                    hashes = compute_hashes(img)
-                    hash_db[item_id] = hashes
-                else:
-                    hash_db[item_id] = {"error": "download_failed"}
-                pbar.update(1)
-
-    # Save progress
-    save_json(PHOTO_INDEX_PATH, photo_index)
-    save_json(HASH_DB_PATH, hash_db)
+    pending = []  # (item_id, img, md5) waiting for a full hash batch
+
+    def flush():
+        batch = compute_hashes_batch([img for _, img, _ in pending], hash_size)
+        for (item_id, _, md5), hashes in zip(pending, batch):
+            hashes["md5"] = md5  # Of the downloaded file, not its pixels
+            hash_db[item_id] = hashes
+            append_hash_record(log, item_id, hashes)
+        log.flush()
+        pbar.update(len(pending))
+        pending.clear()
+
+    async def on_result(result):
+        item_id, img, md5 = result
+        if img is not None:
+            pending.append(result)
+            if len(pending) >= HASH_BATCH_SIZE:
+                # Hash off the event loop so downloads continue meanwhile
+                await asyncio.get_running_loop().run_in_executor(executor, flush)
+        else:
+            if item_id not in hash_db:  # A failed rehash keeps the old hashes
+                hash_db[item_id] = {"error": "download_failed"}
+                append_hash_record(log, item_id, hash_db[item_id])
+            pbar.update(1)
+
+    # Each result is appended to the hash DB as it's hashed, so an
+    # interrupted scan keeps its progress and the next one resumes from there
+    # One thread per in-flight download's decode, plus one for hashing
+    executor = _get_executor(max_workers + 1)
+    with open_hash_db_log() as log, tqdm(total=len(new_items), desc="Processing") as pbar:
+        asyncio.run(_download_thumbnails(new_items, thumb_size, max_workers, on_result, executor))
+        if pending:
+            flush()
+
+    if index_changed:
+        save_json(PHOTO_INDEX_PATH, photo_index)
     
     print(f"Scan complete. {len(hash_db)} images in database.")
     return photo_index, hash_db
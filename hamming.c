@@ -0,0 +1,101 @@
+/*
+ * Hamming distance kernel for dedup.py, loaded through ctypes.
+ *
+ * dedup.py compiles this once per machine with -march=native, so the
+ * preprocessor picks the widest popcount the CPU has:
+ *   AVX-512 VPOPCNTDQ  VPOPCNTQ on the XOR of whole hashes
+ *   AVX2               Mula's nibble-LUT (VPSHUFB) popcount, summed with VPSADBW
+ *   NEON (AArch64)     CNT per byte, then a horizontal ADDV
+ *   otherwise          scalar __builtin_popcountll
+ */
+#include <stddef.h>
+#include <stdint.h>
+
+#if defined(__AVX512F__) && defined(__AVX512VPOPCNTDQ__)
+#include <immintrin.h>
+#define HAMMING_ISA "avx512-vpopcntdq"
+
+static inline int64_t distance(const uint64_t *x, const uint64_t *y, size_t words)
+{
+    __m512i acc = _mm512_setzero_si512();
+    size_t i = 0;
+    for (; i + 8 <= words; i += 8) {
+        __m512i v = _mm512_xor_si512(_mm512_loadu_si512(x + i), _mm512_loadu_si512(y + i));
+        acc = _mm512_add_epi64(acc, _mm512_popcnt_epi64(v));
+    }
+    if (i < words) {
+        /* 256-bit phashes are 4 words: one masked load covers them */
+        __mmask8 m = (__mmask8)((1u << (words - i)) - 1);
+        __m512i v = _mm512_xor_si512(_mm512_maskz_loadu_epi64(m, x + i),
+                                     _mm512_maskz_loadu_epi64(m, y + i));
+        acc = _mm512_add_epi64(acc, _mm512_popcnt_epi64(v));
+    }
+    return _mm512_reduce_add_epi64(acc);
+}
+
+#elif defined(__AVX2__)
+#include <immintrin.h>
+#define HAMMING_ISA "avx2"
+
+static inline int64_t distance(const uint64_t *x, const uint64_t *y, size_t words)
+{
+    const __m256i lut = _mm256_setr_epi8(0, 1, 1, 2, 1, 2, 2, 3, 1, 2, 2, 3, 2, 3, 3, 4,
+                                         0, 1, 1, 2, 1, 2, 2, 3, 1, 2, 2, 3, 2, 3, 3, 4);
+    const __m256i low = _mm256_set1_epi8(0x0f);
+    __m256i acc = _mm256_setzero_si256();
+    size_t i = 0;
+    for (; i + 4 <= words; i += 4) {
+        __m256i v = _mm256_xor_si256(_mm256_loadu_si256((const __m256i *)(x + i)),
+                                     _mm256_loadu_si256((const __m256i *)(y + i)));
+        __m256i lo = _mm256_shuffle_epi8(lut, _mm256_and_si256(v, low));
+        __m256i hi = _mm256_shuffle_epi8(lut, _mm256_and_si256(_mm256_srli_epi16(v, 4), low));
+        acc = _mm256_add_epi64(acc, _mm256_sad_epu8(_mm256_add_epi8(lo, hi), _mm256_setzero_si256()));
+    }
+    int64_t d = _mm256_extract_epi64(acc, 0) + _mm256_extract_epi64(acc, 1)
+              + _mm256_extract_epi64(acc, 2) + _mm256_extract_epi64(acc, 3);
+    for (; i < words; i++)
+        d += __builtin_popcountll(x[i] ^ y[i]);
+    return d;
+}
+
+#elif defined(__ARM_NEON) && defined(__aarch64__)
+#include <arm_neon.h>
+#define HAMMING_ISA "neon"
+
+static inline int64_t distance(const uint64_t *x, const uint64_t *y, size_t words)
+{
+    int64_t d = 0;
+    size_t i = 0;
+    for (; i + 2 <= words; i += 2) {
+        uint8x16_t v = vreinterpretq_u8_u64(veorq_u64(vld1q_u64(x + i), vld1q_u64(y + i)));
+        d += vaddvq_u8(vcntq_u8(v));  /* At most 128, so the u8 sum can't overflow */
+    }
+    for (; i < words; i++)
+        d += __builtin_popcountll(x[i] ^ y[i]);
+    return d;
+}
+
+#else
+#define HAMMING_ISA "scalar"
+
+static inline int64_t distance(const uint64_t *x, const uint64_t *y, size_t words)
+{
+    int64_t d = 0;
+    for (size_t i = 0; i < words; i++)
+        d += __builtin_popcountll(x[i] ^ y[i]);
+    return d;
+}
+#endif
+
+const char *hamming_isa(void)
+{
+    return HAMMING_ISA;
+}
+
+/* out[k] = popcount(hashes[a[k]] ^ hashes[b[k]]) over rows of `words` uint64s */
+void hamming_pair_distances(const uint64_t *hashes, size_t words,
+                            const int64_t *a, const int64_t *b, size_t k, int64_t *out)
+{
+    for (size_t i = 0; i < k; i++)
+        out[i] = distance(hashes + (size_t)a[i] * words, hashes + (size_t)b[i] * words, words);
+}